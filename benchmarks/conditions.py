@@ -0,0 +1,160 @@
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from conditions import compile_conditions, evaluate, pack_state
+from doomdata import Ammo, Weapon, Slots, sbc
+from sbardef import read_conditions
+
+CONDITIONS = [
+    sbc.weaponowned,
+    sbc.weaponselected,
+    sbc.weaponnotselected,
+    sbc.weaponhasammo,
+    sbc.selectedweaponhasammo,
+    sbc.selectedweaponammotype,
+    sbc.weaponslotowned,
+    sbc.weaponslotnotowned,
+    sbc.weaponslotselected,
+    sbc.weaponslotnotselected,
+    sbc.sessiontypeeequal,
+    sbc.sessiontypenotequal,
+    sbc.modeeequal,
+    sbc.modenotequal,
+    sbc.hudmodeequal,
+]
+
+
+class LegacyState:
+    def __init__(self, rng: random.Random):
+        self.weapon_items = [["", rng.randrange(2)] for _ in range(Weapon.numweapons)]
+        self.slot_items = [["", rng.randrange(2)] for _ in range(7)]
+        self.other_items = [["", rng.randrange(2)]]
+        self.weapon_selected = rng.randrange(Weapon.numweapons)
+        self.slot_selected = rng.randrange(7)
+        self.session_current = rng.randrange(3)
+        self.gamemode_current = rng.randrange(5)
+
+    def packed(self) -> tuple:
+        return pack_state(
+            weapons_owned=[value for _, value in self.weapon_items],
+            slots_owned=[value for _, value in self.slot_items],
+            weapon_selected=self.weapon_selected,
+            slot_selected=self.slot_selected,
+            session=self.session_current,
+            gamemode=self.gamemode_current,
+            hudmode=self.other_items[0][1],
+        )
+
+    def check_conditions(self, elem: dict) -> bool:
+        result = True
+        if elem["conditions"] is not None:
+            for condition in elem["conditions"]:
+                cond = condition["condition"]
+                param = condition["param"]
+
+                if cond == sbc.weaponowned:
+                    if param >= 0 and param < Weapon.numweapons:
+                        result &= self.weapon_items[param][1]
+
+                elif cond == sbc.weaponselected:
+                    result &= self.weapon_selected == param
+
+                elif cond == sbc.weaponnotselected:
+                    result &= self.weapon_selected != param
+
+                elif cond == sbc.weaponhasammo:
+                    if param >= 0 and param < Weapon.numweapons:
+                        result &= Ammo.weapon[param] != Ammo.noammo
+
+                elif cond == sbc.selectedweaponhasammo:
+                    result &= Ammo.weapon[self.weapon_selected] != Ammo.noammo
+
+                elif cond == sbc.selectedweaponammotype:
+                    result &= Ammo.weapon[self.weapon_selected] == param
+
+                elif cond == sbc.weaponslotowned:
+                    result &= self.slot_items[Slots.weapon[param - 1] - 1][1]
+
+                elif cond == sbc.weaponslotnotowned:
+                    result &= not self.slot_items[Slots.weapon[param - 1] - 1][1]
+
+                elif cond == sbc.weaponslotselected:
+                    result &= self.slot_selected == param
+
+                elif cond == sbc.weaponslotnotselected:
+                    result &= self.slot_selected != param
+
+                elif cond == sbc.sessiontypeeequal:
+                    result &= self.session_current == param
+
+                elif cond == sbc.sessiontypenotequal:
+                    result &= self.session_current != param
+
+                elif cond == sbc.modeeequal:
+                    result &= self.gamemode_current == param
+
+                elif cond == sbc.modenotequal:
+                    result &= self.gamemode_current != param
+
+                elif cond == sbc.hudmodeequal:
+                    result &= self.other_items[0][1] == param
+
+        return bool(result)
+
+
+def make_elements(rng: random.Random, count: int) -> list:
+    elements = []
+    for _ in range(count):
+        conditions = [
+            {"condition": rng.choice(CONDITIONS), "param": rng.randrange(1, 8)}
+            for _ in range(rng.randrange(1, 5))
+        ]
+        elements.append({"conditions": conditions})
+    return elements
+
+
+def main(count: int = 5000):
+    rng = random.Random(24)
+    elements = make_elements(rng, count)
+    states = [LegacyState(rng) for _ in range(20)]
+
+    typed = [read_conditions("conditions", elem["conditions"]) for elem in elements]
+    compiled = [compile_conditions(conditions) for conditions in typed]
+    for legacy in states:
+        state = legacy.packed()
+        for elem, tests in zip(elements, compiled):
+            assert legacy.check_conditions(elem) == evaluate(tests, state), elem
+
+    legacy = states[0]
+    state = legacy.packed()
+
+    def run_legacy():
+        for elem in elements:
+            legacy.check_conditions(elem)
+
+    def run_compiled():
+        for tests in compiled:
+            evaluate(tests, state)
+
+    compile_time = min(
+        timeit.repeat(
+            lambda: [compile_conditions(conditions) for conditions in typed],
+            number=1,
+            repeat=3,
+        )
+    )
+    legacy_time = min(timeit.repeat(run_legacy, number=10, repeat=3)) / 10
+    compiled_time = min(timeit.repeat(run_compiled, number=10, repeat=3)) / 10
+
+    print(f"{count} conditioned elements")
+    print(f"compile once  {compile_time * 1000:8.2f} ms")
+    print(f"legacy pass   {legacy_time * 1000:8.2f} ms")
+    print(f"compiled pass {compiled_time * 1000:8.2f} ms ({legacy_time / compiled_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,187 @@
+import json
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from doomdata import sbc
+from wadfile import ENTRY, HEADER
+
+# Synthetic SBARDEFs and WADs for the benchmark suite. Everything is drawn
+# from a seeded random.Random, so the same arguments give the same bytes.
+
+CONDITIONS = [
+    sbc.weaponowned,
+    sbc.weaponselected,
+    sbc.weaponnotselected,
+    sbc.weaponhasammo,
+    sbc.selectedweaponhasammo,
+    sbc.selectedweaponammotype,
+    sbc.weaponslotowned,
+    sbc.weaponslotnotowned,
+    sbc.weaponslotselected,
+    sbc.weaponslotnotselected,
+    sbc.sessiontypeeequal,
+    sbc.sessiontypenotequal,
+    sbc.modeeequal,
+    sbc.modenotequal,
+    sbc.hudmodeequal,
+]
+
+FONT_STEMS = ("STT", "STY", "STG", "STR")
+GLYPHS = [str(num) for num in range(10)] + ["MINUS", "PRCNT"]
+
+
+def patch_lump(rng: random.Random, width: int, height: int, left: int = 0, top: int = 0) -> bytes:
+    # A Doom picture with a few transparent gaps per column.
+    header = struct.pack("<HHhh", width, height, left, top)
+    offset = len(header) + 4 * width
+    offsets = []
+    columns = []
+    for _ in range(width):
+        column = bytearray()
+        row = 0
+        while row < height:
+            row += rng.randrange(0, 4)
+            length = min(rng.randrange(1, 32), height - row)
+            if length <= 0:
+                break
+            column += bytes((row, length, 0))
+            column += bytes(rng.randrange(0, 247) for _ in range(length))
+            column += b"\x00"
+            row += length
+        column += b"\xff"
+        offsets.append(offset)
+        offset += len(column)
+        columns.append(bytes(column))
+    return header + struct.pack(f"<{width}I", *offsets) + b"".join(columns)
+
+
+def make_conditions(rng: random.Random, density: float) -> list:
+    if rng.random() >= density:
+        return None
+    return [
+        {"condition": rng.choice(CONDITIONS), "param": rng.randrange(1, 8)}
+        for _ in range(rng.randrange(1, 4))
+    ]
+
+
+def make_element(rng: random.Random, patches: list, fonts: list, density: float) -> tuple:
+    common = {
+        "x": rng.randrange(0, 300),
+        "y": rng.randrange(0, 32),
+        "alignment": rng.randrange(16),
+        "tranmap": None,
+        "translation": None,
+        "conditions": make_conditions(rng, density),
+        "children": None,
+    }
+    roll = rng.random()
+    if fonts and roll < 0.2:
+        kind = "number" if roll < 0.1 else "percent"
+        values = {"font": rng.choice(fonts), "type": rng.randrange(8), "param": rng.randrange(8), "maxlength": 3}
+    elif roll < 0.25:
+        kind, values = "face", {}
+    elif roll < 0.3:
+        kind, values = "canvas", {}
+    else:
+        kind, values = "graphic", {"patch": rng.choice(patches)}
+    return kind, {**common, **values}
+
+
+def make_sbardef(
+    elements: int = 200,
+    depth: int = 3,
+    nesting: float = 0.3,
+    condition_density: float = 0.5,
+    numberfonts: int = 2,
+    statusbars: int = 2,
+    patches: list = ("STBAR",),
+    seed: int = 0,
+) -> dict:
+    # Elements are spread over the status bars. Each one is nested under an
+    # earlier element with probability `nesting`, as long as that keeps the
+    # tree within `depth` levels.
+    rng = random.Random(seed)
+    patches = list(patches)
+    fonts = [f"Font{i}" for i in range(numberfonts)]
+
+    bars = [
+        {"height": 32 if i == 0 else 200, "fullscreenrender": i > 0, "fillflat": None, "children": []}
+        for i in range(statusbars)
+    ]
+    placed = []  # (children list, depth) for every element so far
+    for _ in range(elements):
+        kind, values = make_element(rng, patches, fonts, condition_density)
+        candidates = [entry for entry in placed if entry[1] < depth]
+        if candidates and rng.random() < nesting:
+            parent, level = rng.choice(candidates)
+            if parent["children"] is None:
+                parent["children"] = []
+            siblings = parent["children"]
+            level += 1
+        else:
+            siblings = rng.choice(bars)["children"]
+            level = 1
+        siblings.append({kind: values})
+        placed.append((values, level))
+
+    return {
+        "type": "statusbar",
+        "version": "1.0.0",
+        "metadata": None,
+        "data": {
+            "numberfonts": [
+                {"name": name, "type": 0, "stem": FONT_STEMS[i % len(FONT_STEMS)]} for i, name in enumerate(fonts)
+            ],
+            "statusbars": bars,
+        },
+    }
+
+
+def patch_names(count: int) -> list:
+    return [f"PAT{i:05d}" for i in range(count)]
+
+
+def make_wad(
+    path: str,
+    patches: int = 2000,
+    sprites: int = 500,
+    sbardef: dict = None,
+    numberfonts: int = 2,
+    seed: int = 0,
+):
+    # Status bar graphics and font glyphs sit outside any marker, patches
+    # between P_START/P_END and sprites between S_START/S_END, as in a
+    # real PWAD. The SBARDEF lump comes last.
+    rng = random.Random(seed)
+    lumps = [("STBAR", patch_lump(rng, 320, 32)), ("STFST00", patch_lump(rng, 24, 29, 1, 2))]
+    for stem in FONT_STEMS[:numberfonts]:
+        for glyph in GLYPHS:
+            lumps.append((f"{stem}NUM{glyph}" if glyph.isdigit() else stem + glyph, patch_lump(rng, 14, 16)))
+
+    lumps.append(("P_START", b""))
+    for name in patch_names(patches):
+        lumps.append((name, patch_lump(rng, rng.randint(8, 64), rng.randint(8, 48))))
+    lumps.append(("P_END", b""))
+
+    lumps.append(("S_START", b""))
+    for i in range(sprites):
+        lumps.append((f"SPR{i:04d}A0", patch_lump(rng, rng.randint(16, 64), rng.randint(16, 64))))
+    lumps.append(("S_END", b""))
+
+    if sbardef is not None:
+        lumps.append(("SBARDEF", json.dumps(sbardef, indent=2).encode()))
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(b"PWAD", 0, 0))
+        entries = []
+        for name, data in lumps:
+            entries.append(ENTRY.pack(file.tell() if data else 0, len(data), name.encode()))
+            file.write(data)
+        directory = file.tell()
+        file.write(b"".join(entries))
+        file.seek(0)
+        file.write(HEADER.pack(b"PWAD", len(entries), directory))
@@ -0,0 +1,66 @@
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import omg.palette
+from PIL import Image
+
+from keying import key_to_alpha
+
+SIZES = [(320, 200), (640, 400), (1280, 800)]
+
+
+def legacy_cyan_to_alpha(image):
+    image = image.convert("RGBA")
+
+    data = image.getdata()
+    newdata = []
+    for item in data:
+        if item[0] == 255 and item[1] == 0 and item[2] == 255:
+            newdata.append((255, 0, 255, 0))
+        else:
+            newdata.append(item)
+    image.putdata(newdata)
+
+    return image
+
+
+def make_patch(width: int, height: int) -> Image.Image:
+    palette = omg.palette.default
+    rng = random.Random(width * height)
+    pixels = bytes(
+        palette.tran_index if rng.random() < 0.3 else rng.randrange(256)
+        for _ in range(width * height)
+    )
+    image = Image.frombytes("P", (width, height), pixels)
+    image.putpalette(palette.save_bytes)
+    return image
+
+
+def bench(func, image, number: int) -> float:
+    return min(timeit.repeat(lambda: func(image), number=number, repeat=3)) / number
+
+
+def main():
+    print(f"{'size':>10} {'legacy ms':>10} {'palette ms':>11} {'bands ms':>9} {'speedup':>8}")
+    for width, height in SIZES:
+        patch = make_patch(width, height)
+        rgb = patch.convert("RGB")
+        expected = legacy_cyan_to_alpha(patch)
+        assert key_to_alpha(patch).getchannel("A") == expected.getchannel("A")
+        assert key_to_alpha(rgb).getchannel("A") == expected.getchannel("A")
+
+        legacy = bench(legacy_cyan_to_alpha, patch, 3)
+        palette = bench(key_to_alpha, patch, 50)
+        bands = bench(key_to_alpha, rgb, 50)
+        print(
+            f"{width:>4}x{height:<5} {legacy * 1000:>10.2f} {palette * 1000:>11.3f} "
+            f"{bands * 1000:>9.3f} {legacy / palette:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
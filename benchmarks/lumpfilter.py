@@ -0,0 +1,100 @@
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from lumpindex import LumpIndex, LumpQuery
+
+NAMESPACES = ("graphics", "patches", "sprites")
+
+
+class FakeLump:
+    __slots__ = ("namespace", "dimensions")
+
+    def __init__(self, namespace: str, dimensions: tuple):
+        self.namespace = namespace
+        self.dimensions = dimensions
+
+
+def make_lumps(rng: random.Random, count: int) -> dict:
+    lumps = {}
+    alphabet = string.ascii_uppercase + string.digits
+    while len(lumps) < count:
+        name = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 8)))
+        lumps[name] = FakeLump(rng.choice(NAMESPACES), (rng.randint(1, 320), rng.randint(1, 200)))
+    return lumps
+
+
+def scan(names: list, lumps: dict, query: LumpQuery) -> list:
+    text = query.text.upper()
+    rows = []
+    for row, name in enumerate(names):
+        lump = lumps[name]
+        if text.startswith("^"):
+            if not name.startswith(text[1:]):
+                continue
+        elif text not in name:
+            continue
+        if query.namespaces and lump.namespace not in query.namespaces:
+            continue
+        if query.max_width and lump.dimensions[0] > query.max_width:
+            continue
+        if query.max_height and lump.dimensions[1] > query.max_height:
+            continue
+        rows.append(row)
+    return rows
+
+
+def typing_session(rng: random.Random, names: list) -> list:
+    # Type a name out one key at a time, then delete it again.
+    target = rng.choice(names)
+    prefix = "^" if rng.random() < 0.3 else ""
+    start = 0 if prefix else rng.randrange(len(target))
+    namespaces = frozenset((rng.choice(NAMESPACES),)) if rng.random() < 0.3 else frozenset()
+    max_width = rng.choice((0, 0, 100, 200))
+
+    texts = [target[start:end] for end in range(start, len(target) + 1)]
+    texts += texts[-2::-1]
+    return [LumpQuery(prefix + text, namespaces, max_width, 0) for text in texts]
+
+
+def main(count: int = 20000, sessions: int = 200):
+    rng = random.Random(24)
+    lumps = make_lumps(rng, count)
+    names = list(lumps)
+
+    start = time.perf_counter()
+    index = LumpIndex(lumps)
+    build_time = time.perf_counter() - start
+
+    queries = [query for _ in range(sessions) for query in typing_session(rng, names)]
+
+    indexed = []
+    for query in queries:
+        start = time.perf_counter()
+        rows = index.search(query)
+        indexed.append(time.perf_counter() - start)
+        assert rows == scan(names, lumps, query), query
+
+    # What the regex proxy did: compile the pattern and test every name.
+    legacy = []
+    for query in queries:
+        start = time.perf_counter()
+        pattern = re.compile(query.text, re.IGNORECASE)
+        [name for name in names if pattern.search(name)]
+        legacy.append(time.perf_counter() - start)
+
+    indexed.sort()
+    legacy.sort()
+    print(f"{count} lumps, {len(queries)} keystrokes")
+    print(f"index build        {build_time * 1000:8.2f} ms")
+    print(f"regex scan median  {legacy[len(legacy) // 2] * 1000:8.2f} ms, worst {legacy[-1] * 1000:.2f} ms")
+    print(f"indexed median     {indexed[len(indexed) // 2] * 1000:8.2f} ms, worst {indexed[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QApplication, QTreeView, QTreeWidget, QTreeWidgetItem
+
+from properties import PropertyModel, parse_value
+from sbardef import Graphic
+
+SESSIONS = (10, 100, 1000)
+EDITS = 50
+
+
+def make_elements(count: int) -> list:
+    return [
+        Graphic(x=i, y=0, alignment=0, tranmap=None, translation=None, conditions=None, patch="STTNUM0", children=None)
+        for i in range(count)
+    ]
+
+
+class Legacy:
+    # What Controller.update_properties did: rebuild the tree and connect a
+    # fresh closure on every selection, never disconnecting the old ones.
+    def __init__(self):
+        self.tree = QTreeWidget()
+        self.tree.setColumnCount(2)
+        self.dispatched = 0
+
+    def select(self, elem):
+        self.tree.blockSignals(True)
+        self.tree.clear()
+        for key, value in elem.items():
+            if key != "children":
+                item = QTreeWidgetItem([key, str(value)])
+                item.setFlags(item.flags() | Qt.ItemIsEditable)
+                self.tree.insertTopLevelItem(0, item)
+        self.tree.blockSignals(False)
+
+        def handler(item, column):
+            if column != 1:
+                return
+            key = item.text(0)
+            old_value = elem.get(key)
+            new_value = parse_value(item.text(1), old_value)
+            if new_value != old_value:
+                self.dispatched += 1
+
+        self.tree.itemChanged.connect(handler)
+
+    def edit(self, value: int):
+        item = self.tree.findItems("x", Qt.MatchExactly)[0]
+        item.setText(1, str(value))
+
+
+class Current:
+    def __init__(self):
+        self.properties = PropertyModel()
+        self.view = QTreeView()
+        self.view.setModel(self.properties)
+        self.dispatched = 0
+        self.properties.valueEdited.connect(self.edited)
+
+    def edited(self, eid, key, value):
+        self.dispatched += 1
+        self.properties.elem.set(key, value)
+        self.properties.refresh()
+
+    def select(self, elem):
+        self.properties.set_element(0, elem)
+
+    def edit(self, value: int):
+        row = self.properties.keys.index("x")
+        self.properties.setData(self.properties.index(row, 1), str(value))
+
+
+def run(editor, elements: list, clicks: int) -> tuple:
+    for i in range(clicks):
+        editor.select(elements[i % len(elements)])
+
+    editor.dispatched = 0
+    start = time.perf_counter()
+    for i in range(EDITS):
+        editor.edit(10000 + i)
+    elapsed = (time.perf_counter() - start) / EDITS
+    return elapsed, editor.dispatched / EDITS
+
+
+def main():
+    app = QApplication.instance() or QApplication(sys.argv)
+    elements = make_elements(200)
+
+    print(f"{'clicks':>8} {'legacy ms/edit':>15} {'handlers':>9} {'model ms/edit':>14} {'handlers':>9}")
+    for clicks in SESSIONS:
+        legacy_time, legacy_calls = run(Legacy(), elements, clicks)
+        current_time, current_calls = run(Current(), elements, clicks)
+        print(
+            f"{clicks:8} {legacy_time * 1000:15.3f} {legacy_calls:9.0f} "
+            f"{current_time * 1000:14.3f} {current_calls:9.0f}"
+        )
+
+    return app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import sbardef
+import sbardefjson
+
+
+def make_document(rng: random.Random, count: int) -> dict:
+    def common():
+        return {
+            "x": rng.randrange(320),
+            "y": rng.randrange(32),
+            "alignment": rng.randrange(16),
+            "tranmap": None,
+            "translation": None,
+            "conditions": [
+                {"condition": rng.randrange(1, 20), "param": rng.randrange(8)}
+                for _ in range(rng.randrange(3))
+            ]
+            or None,
+            "children": None,
+        }
+
+    def element(depth: int) -> dict:
+        kind = rng.choice(("graphic", "number", "percent", "face"))
+        values = common()
+        if kind == "graphic":
+            values["patch"] = f"PAT{rng.randrange(10000):05}"
+        elif kind != "face":
+            values.update(font="BigFont", type=rng.randrange(3), param=0, maxlength=3)
+        if depth < 2 and rng.random() < 0.2:
+            values["children"] = [element(depth + 1) for _ in range(rng.randrange(1, 4))]
+        return {kind: values}
+
+    statusbars = []
+    for _ in range(4):
+        statusbars.append(
+            {
+                "height": 32,
+                "fullscreenrender": False,
+                "fillflat": None,
+                "children": [element(0) for _ in range(count // 4)],
+            }
+        )
+    return {
+        "type": "statusbar",
+        "version": "1.0.0",
+        "metadata": None,
+        "data": {
+            "numberfonts": [{"name": "BigFont", "type": 0, "stem": "STT"}],
+            "statusbars": statusbars,
+        },
+    }
+
+
+def measure(build) -> tuple:
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def traverse_dicts(children) -> int:
+    # The shape of the old draw loop: unwrap each element, read its
+    # position and recurse.
+    total = 0
+    for child in children or []:
+        values = next(iter(child.values()))
+        total += values["x"] + values["y"] + values["alignment"]
+        if values["conditions"] is not None:
+            total += len(values["conditions"])
+        total += traverse_dicts(values["children"])
+    return total
+
+
+def traverse_records(children) -> int:
+    total = 0
+    for child in children or []:
+        total += child.x + child.y + child.alignment
+        if child.conditions is not None:
+            total += len(child.conditions)
+        total += traverse_records(child.children)
+    return total
+
+
+def main(count: int = 20000):
+    rng = random.Random(24)
+    text = json.dumps(make_document(rng, count))
+
+    document, dict_size = measure(lambda: json.loads(text))
+    typed, typed_size = measure(lambda: sbardef.load(json.loads(text)))
+    assert typed.to_json() == document
+
+    dict_bars = document["data"]["statusbars"]
+    dict_time = min(
+        timeit.repeat(lambda: [traverse_dicts(bar["children"]) for bar in dict_bars], number=5, repeat=3)
+    ) / 5
+    typed_time = min(
+        timeit.repeat(lambda: [traverse_records(bar.children) for bar in typed.statusbars], number=5, repeat=3)
+    ) / 5
+    assert [traverse_dicts(bar["children"]) for bar in dict_bars] == [
+        traverse_records(bar.children) for bar in typed.statusbars
+    ]
+
+    load_time = min(timeit.repeat(lambda: sbardef.load(document), number=1, repeat=3))
+    dict_load_time = min(timeit.repeat(lambda: sbardef.load(json.loads(text)), number=1, repeat=3))
+    stream_time = min(timeit.repeat(lambda: sbardefjson.loads(text), number=1, repeat=3))
+    assert sbardefjson.loads(text).to_json() == document
+
+    tracemalloc.start()
+    sbardef.load(json.loads(text))
+    dict_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    tracemalloc.start()
+    sbardefjson.loads(text)
+    stream_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    save_time = min(timeit.repeat(typed.to_json, number=1, repeat=3))
+
+    print(f"{count} top-level elements, {len(text) / 1024:.0f} KiB of JSON")
+    print(f"nested dicts   {dict_size / 1024 / 1024:8.2f} MiB, traversal {dict_time * 1000:8.2f} ms")
+    print(f"typed records  {typed_size / 1024 / 1024:8.2f} MiB, traversal {typed_time * 1000:8.2f} ms")
+    print(f"validate+build {load_time * 1000:8.2f} ms, to_json {save_time * 1000:.2f} ms")
+    print(f"json.loads+build {dict_load_time * 1000:8.2f} ms, peak {dict_peak / 1024 / 1024:.2f} MiB")
+    print(f"streaming parse  {stream_time * 1000:8.2f} ms, peak {stream_peak / 1024 / 1024:.2f} MiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
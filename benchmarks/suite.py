@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from generate import make_sbardef, make_wad, patch_names
+
+# Runs every scenario against the same generated WAD and writes the timings
+# as JSON. Given a baseline written by an earlier run, it reports what got
+# slower and exits non-zero if anything slowed down past the threshold:
+#
+#   python benchmarks/suite.py --output baseline.json
+#   python benchmarks/suite.py --baseline baseline.json
+
+SIZES = {
+    "small": {"patches": 300, "sprites": 100, "elements": 100, "repeat": 5},
+    "default": {"patches": 2000, "sprites": 500, "elements": 500, "repeat": 10},
+    "large": {"patches": 8000, "sprites": 2000, "elements": 3000, "repeat": 10},
+}
+
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    # setup(fixture) returns the function to time; it may also return a
+    # (function, teardown) pair.
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+
+    return register
+
+
+class Fixture:
+    def __init__(self, size: dict, seed: int):
+        self.size = size
+        self.directory = tempfile.mkdtemp(prefix="sbarbench")
+        self.wad = os.path.join(self.directory, "bench.wad")
+        self.sbardef = make_sbardef(
+            elements=size["elements"],
+            depth=3,
+            condition_density=0.5,
+            numberfonts=2,
+            statusbars=2,
+            patches=["STBAR"] + patch_names(size["patches"]),
+            seed=seed,
+        )
+        make_wad(self.wad, size["patches"], size["sprites"], self.sbardef, numberfonts=2, seed=seed)
+        self.app = None
+
+    def model(self, prepared: bool = True):
+        from model import SBarModel
+
+        model = SBarModel()
+        model.load_wad(self.wad)
+        if prepared:
+            model.prepare(max_workers=1)
+        return model
+
+    def qt(self):
+        if self.app is None:
+            from PySide6.QtWidgets import QApplication
+
+            self.app = QApplication.instance() or QApplication([])
+        return self.app
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+@scenario("model.load_wad")
+def load_wad(fixture: Fixture):
+    from model import SBarModel
+
+    def run():
+        SBarModel().load_wad(fixture.wad)
+
+    return run
+
+
+@scenario("model.load_fonts")
+def load_fonts(fixture: Fixture):
+    # Patches are decoded once; this times building the font atlases.
+    model = fixture.model()
+    return model.load_fonts
+
+
+@scenario("model.check_conditions")
+def check_conditions(fixture: Fixture):
+    model = fixture.model(prepared=False)
+    state = model.game_state()
+    eids = [ref.id for ref in model.elements]
+
+    def run():
+        for eid in eids:
+            model.check_conditions(eid, state)
+
+    return run
+
+
+@scenario("view.draw")
+def view_draw(fixture: Fixture):
+    # Redraw of an unchanged status bar: every item is already on the scene.
+    fixture.qt()
+    from view import View
+
+    view = View(fixture.model())
+    view.draw(0, lambda eid: None)
+    return lambda: view.draw(0, lambda eid: None)
+
+
+@scenario("view.draw_cold")
+def view_draw_cold(fixture: Fixture):
+    fixture.qt()
+    from view import View
+
+    view = View(fixture.model())
+
+    def run():
+        view.clear_scene()
+        view.draw(0, lambda eid: None)
+
+    return run
+
+
+@scenario("preview.timeline")
+def preview_timeline(fixture: Fixture):
+    # One pass over the demo timeline, tic by tic; compare the time per
+    # call with timeline.length * preview.TIC_MS to see if it keeps up.
+    fixture.qt()
+    from preview import TimelinePreview
+    from view import View
+
+    model = fixture.model()
+    view = View(model)
+    view.draw(0, lambda eid: None)
+    preview = TimelinePreview(model, view)
+    preview.start()
+    preview.timer.stop()
+
+    def run():
+        for tic in range(preview.timeline.length):
+            preview.step(tic)
+
+    return run, preview.stop
+
+
+@scenario("lumps.filter")
+def lumps_filter(fixture: Fixture):
+    # The lumps dialog model: index every graphic, then type a few names out
+    # one key at a time.
+    fixture.qt()
+    from lumpindex import LumpQuery
+    from view import LumpFilterModel, LumpModel
+
+    model = fixture.model(prepared=False)
+    rng = random.Random(1)
+    names = rng.sample(sorted(model.lumps), 5)
+    queries = [LumpQuery(text=name[:end]) for name in names for end in range(len(name) + 1)]
+
+    lump_model = LumpModel(model.lumps, model.load_thumbnail)
+    proxy = LumpFilterModel()
+
+    def run():
+        proxy.setSourceModel(lump_model)
+        for query in queries:
+            proxy.setQuery(query)
+            for row in range(min(proxy.rowCount(), 50)):
+                proxy.index(row, 0).data()
+        proxy.setQuery(LumpQuery())
+
+    return run, lump_model.close
+
+
+def measure(run, repeat: int, sample_ms: float = 20.0) -> dict:
+    # Fast scenarios run several times per sample, so each sample lasts at
+    # least sample_ms and timer resolution does not dominate; times are per
+    # call.
+    start = time.perf_counter()
+    run()  # warm up
+    first = (time.perf_counter() - start) * 1000
+    number = max(1, int(sample_ms / first)) if first > 0 else 1
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) * 1000 / number)
+    return {
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.fmean(times),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def run_suite(size: str = "default", seed: int = 0, only: list = None, repeat: int = None) -> dict:
+    params = SIZES[size]
+    fixture = Fixture(params, seed)
+    results = {}
+    try:
+        for name, setup in SCENARIOS.items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            prepared = setup(fixture)
+            run, teardown = prepared if isinstance(prepared, tuple) else (prepared, None)
+            try:
+                results[name] = measure(run, repeat or params["repeat"])
+            finally:
+                if teardown is not None:
+                    teardown()
+    finally:
+        fixture.close()
+
+    return {
+        "meta": {
+            "size": size,
+            "seed": seed,
+            "params": params,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    # Best times are compared, as they are the least disturbed by whatever
+    # else the machine was doing. A scenario missing from either side is
+    # skipped.
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["min_ms"] / base["min_ms"] if base["min_ms"] else 1.0
+        rows.append((name, base["min_ms"], result["min_ms"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the SBARDEF editor benchmark suite.")
+    parser.add_argument("--size", choices=SIZES, default="default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int)
+    parser.add_argument("--only", action="append", help="run scenarios starting with this prefix")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against results written by an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown (default 0.10)")
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.size, args.seed, args.only, args.repeat)
+
+    for name, result in current["results"].items():
+        print(f"{name:24} median {result['median_ms']:9.3f} ms  min {result['min_ms']:9.3f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(current, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["meta"]["size"] != args.size or baseline["meta"]["seed"] != args.seed:
+            print("warning: baseline was run with a different size or seed")
+
+        regressions = 0
+        print(f"\n{'scenario':24} {'baseline min':>12} {'now min':>10} {'ratio':>7}")
+        for name, before, after, ratio, regressed in compare(current, baseline, args.threshold):
+            regressions += regressed
+            print(f"{name:24} {before:12.3f} {after:10.3f} {ratio:7.2f}{'  SLOWER' if regressed else ''}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
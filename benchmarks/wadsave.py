@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from wadfile import ENTRY, HEADER, WadFile, replace_lump
+
+
+def make_wad(path: str, size: int, lumps: int = 4000):
+    # Lump contents are left as holes in a sparse file; only the directory
+    # and the SBARDEF are real bytes.
+    lumpsize = size // lumps
+    entries = [(HEADER.size + i * lumpsize, lumpsize, f"L{i:06}".encode()) for i in range(lumps)]
+    sbardef = json.dumps({"type": "statusbar", "version": "1.0.0", "data": {}}).encode()
+    offset = HEADER.size + lumps * lumpsize
+    entries.append((offset, len(sbardef), b"SBARDEF"))
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(b"PWAD", len(entries), offset + len(sbardef)))
+        file.seek(offset)
+        file.write(sbardef)
+        for entry in entries:
+            file.write(ENTRY.pack(*entry))
+
+
+def main(megabytes: int = 300, saves: int = 20):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "big.wad")
+        make_wad(path, megabytes * 1024 * 1024)
+        document = json.dumps({"pad": "x" * 20000}, indent=2).encode()
+
+        times = []
+        for i in range(saves):
+            start = time.perf_counter()
+            replace_lump(path, "SBARDEF", document + str(i).encode())
+            times.append(time.perf_counter() - start)
+        assert WadFile(path).find("SBARDEF").data == document + str(saves - 1).encode()
+
+        # What saving through a tool that rewrites the archive costs.
+        start = time.perf_counter()
+        shutil.copyfile(path, path + ".copy")
+        with open(path + ".copy", "rb+") as file:
+            os.fsync(file.fileno())
+        rewrite = time.perf_counter() - start
+
+        times.sort()
+        print(f"{megabytes} MB WAD, {len(document) // 1024} KiB SBARDEF, {saves} saves")
+        print(f"replace lump  median {times[len(times) // 2] * 1000:8.2f} ms, worst {times[-1] * 1000:.2f} ms")
+        print(f"full rewrite         {rewrite * 1000:8.2f} ms")
+        print(f"file size after saves {os.path.getsize(path) / 1024 / 1024:.2f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from diskcache import DiskCache, user_cache_dir
+from model import SBarModel
+from patchcache import content_hash
+from playerstate import FIELDS as PLAYER_FIELDS
+from render import BACKGROUND, STATE_FIELDS, StatusBarRenderer, apply_state, state_matrix
+from sweep import DEFAULT_LIMIT, sweep
+
+
+def load_file(path: str, wads: list, cache_dir: str) -> SBarModel:
+    model = SBarModel(DiskCache(cache_dir) if cache_dir else None)
+    for wad in wads:
+        model.add_wad(wad)
+    if path.lower().endswith(".json"):
+        model.load_json(path)
+    else:
+        model.add_wad(path)
+
+    if model.sbardef is None:
+        raise ValueError(f"{path} has no SBARDEF")
+
+    # Files are already spread across processes; decode serially in each.
+    model.prepare(max_workers=1)
+    return model
+
+
+def render_file(
+    path: str, wads: list, cache_dir: str, outdir: str, states: list, transparent: bool
+) -> list:
+    model = load_file(path, wads, cache_dir)
+    renderer = StatusBarRenderer(model, (0, 0, 0, 0) if transparent else BACKGROUND)
+
+    target = os.path.join(outdir, os.path.basename(path))
+    os.makedirs(target, exist_ok=True)
+
+    written = []
+    for barindex in range(len(model.sbardef.statusbars)):
+        for state in states:
+            apply_state(model, state)
+            name = "".join(f"_{field}{value}" for field, value in state.items())
+            filename = os.path.join(target, f"bar{barindex}{name}.png")
+            renderer.render(barindex).save(filename)
+            written.append(filename)
+
+    return written
+
+
+def sweep_file(
+    path: str, wads: list, cache_dir: str, outdir: str, transparent: bool, limit: int, fixed: dict
+) -> list:
+    model = load_file(path, wads, cache_dir)
+    apply_state(model, fixed)
+    renderer = StatusBarRenderer(model, (0, 0, 0, 0) if transparent else BACKGROUND)
+
+    target = os.path.join(outdir, os.path.basename(path))
+    os.makedirs(target, exist_ok=True)
+
+    written = []
+    statusbars = []
+    for barindex in range(len(model.sbardef.statusbars)):
+        images = {}
+        states = []
+        for group in sweep(model, barindex, limit):
+            image = renderer.render(barindex, group.state)
+            digest = content_hash(image.tobytes()).hex()
+            # Different element sets can still look the same.
+            if digest not in images:
+                images[digest] = f"bar{barindex}_{digest}.png"
+                image.save(os.path.join(target, images[digest]))
+                written.append(images[digest])
+            states.extend(dict(state, image=digest) for state in group.classes)
+        statusbars.append({"index": barindex, "images": images, "states": states})
+
+    with open(os.path.join(target, "manifest.json"), "w") as file:
+        json.dump({"source": path, "statusbars": statusbars}, file, indent=2)
+
+    return written
+
+
+def int_list(text: str) -> list[int]:
+    return [int(value) for value in text.split(",")]
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Render every status bar in SBARDEF WAD or JSON files to PNG images."
+    )
+    parser.add_argument("inputs", nargs="+", help="WAD or JSON files to render")
+    parser.add_argument(
+        "--wad",
+        action="append",
+        default=[],
+        help="resource WAD loaded under every input, e.g. the IWAD (repeatable)",
+    )
+    parser.add_argument("-o", "--output", default="renders", help="output directory")
+    parser.add_argument(
+        "--cache-dir",
+        default=user_cache_dir(),
+        help="where decoded graphics are kept between runs",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="decode everything, keep nothing")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--transparent", action="store_true", help="leave the background transparent")
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="render each distinct look over all condition states once and write manifest.json",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=DEFAULT_LIMIT,
+        help="maximum number of state classes per status bar in a sweep",
+    )
+    for field in STATE_FIELDS:
+        parser.add_argument(
+            f"--{field}",
+            type=int_list,
+            metavar="N[,N...]",
+            help=f"{field} values to render, one image per combination",
+        )
+    args = parser.parse_args(argv)
+
+    axes = {field: getattr(args, field) for field in STATE_FIELDS if getattr(args, field)}
+    if args.sweep and set(axes) - set(PLAYER_FIELDS):
+        parser.error("--sweep covers the condition states; only player values like --health can be fixed")
+
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        if args.sweep:
+            # Player values don't affect conditions; use the first value.
+            fixed = {field: values[0] for field, values in axes.items()}
+            futures = {
+                executor.submit(
+                    sweep_file, path, args.wad, cache_dir, args.output, args.transparent, args.limit, fixed
+                ): path
+                for path in args.inputs
+            }
+        else:
+            states = state_matrix(axes)
+            futures = {
+                executor.submit(
+                    render_file, path, args.wad, cache_dir, args.output, states, args.transparent
+                ): path
+                for path in args.inputs
+            }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                written = future.result()
+            except Exception as e:
+                print(f"Could not render {path}: {e}", file=sys.stderr)
+                failed += 1
+            else:
+                print(f"{path}: {len(written)} images")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+from PySide6.QtGui import QUndoCommand
+
+from sbardef import Element
+
+# Each command stores only the element IDs and the values it swaps, not a
+# copy of the SBARDEF. A removed subtree is kept by reference and put back
+# under its old IDs, so later commands that name those IDs stay valid.
+
+MOVE_ID = 1
+
+
+class SetValueCommand(QUndoCommand):
+    def __init__(self, editor, eid: int, key: str, value):
+        super().__init__(f"Change {key}")
+        self.editor = editor
+        self.eid = eid
+        self.key = key
+        self.old = editor.model.elements[eid].elem.get(key)
+        self.new = value
+
+    def redo(self):
+        self.editor.model.update_element(self.eid, self.key, self.new)
+        self.editor.element_changed(self.eid)
+
+    def undo(self):
+        self.editor.model.update_element(self.eid, self.key, self.old)
+        self.editor.element_changed(self.eid)
+
+
+class MoveElementCommand(QUndoCommand):
+    # Moves a group of elements to {eid: (x, y)}. Moves pushed with the same
+    # drag number merge into one step, so a drag undoes in one go however
+    # many frames it sent.
+    def __init__(self, editor, positions: dict, drag: int = None):
+        super().__init__("Move element" if len(positions) == 1 else f"Move {len(positions)} elements")
+        elements = editor.model.elements
+        self.editor = editor
+        self.drag = drag
+        self.old = {eid: (elements[eid].elem.x, elements[eid].elem.y) for eid in positions}
+        self.new = dict(positions)
+
+    def id(self) -> int:
+        return MOVE_ID
+
+    def mergeWith(self, other) -> bool:
+        if other.drag is None or other.drag != self.drag or other.new.keys() != self.new.keys():
+            return False
+        self.new = other.new
+        self.setObsolete(self.new == self.old)
+        return True
+
+    def redo(self):
+        self.move(self.new)
+
+    def undo(self):
+        self.move(self.old)
+
+    def move(self, positions: dict):
+        model = self.editor.model
+        for eid, (x, y) in positions.items():
+            model.update_element(eid, "x", x)
+            model.update_element(eid, "y", y)
+        self.editor.elements_changed(positions.keys())
+
+
+class AddElementCommand(QUndoCommand):
+    def __init__(self, editor, barindex: int, elem: Element):
+        super().__init__("Add element")
+        self.editor = editor
+        self.barindex = barindex
+        self.elem = elem
+        self.ids = None
+
+    def redo(self):
+        model = self.editor.model
+        if self.ids is None:
+            self.eid = model.add_element(self.barindex, self.elem)
+            self.ids = model.elements.subtree(self.eid)
+        else:
+            statusbar = model.sbardef.statusbars[self.barindex]
+            model.insert_element(statusbar, self.index, self.elem, self.ids)
+        self.index = model.elements[self.eid].index
+        self.editor.element_added(self.eid)
+
+    def undo(self):
+        self.editor.model.remove_element(self.eid)
+        self.editor.elements_removed(self.ids)
+
+
+class RemoveElementCommand(QUndoCommand):
+    def __init__(self, editor, eid: int):
+        super().__init__("Remove element")
+        self.editor = editor
+        self.eid = eid
+
+    def redo(self):
+        model = self.editor.model
+        self.ids = model.elements.subtree(self.eid)
+        ref = model.remove_element(self.eid)
+        self.parent = ref.parent
+        self.index = ref.index
+        self.elem = ref.elem
+        self.editor.elements_removed(self.ids)
+
+    def undo(self):
+        self.editor.model.insert_element(self.parent, self.index, self.elem, self.ids)
+        self.editor.element_added(self.eid)
@@ -0,0 +1,218 @@
+from doomdata import Ammo, Weapon, Slots, sbc
+
+# Fields of the packed game state. WEAPONS and SLOTS hold one bit per owned
+# weapon or slot, the remaining fields hold a single bit for the current
+# value, so every condition reduces to a mask test on one field.
+WEAPONS = 0
+SLOTS = 1
+WEAPON_SELECTED = 2
+SLOT_SELECTED = 3
+SESSION = 4
+GAMEMODE = 5
+HUDMODE = 6
+NUMFIELDS = 7
+
+ONEHOT_FIELDS = (WEAPON_SELECTED, SLOT_SELECTED, SESSION, GAMEMODE, HUDMODE)
+
+# Marks a test on a one-hot field: the field must have one of the mask bits.
+ANY = -1
+
+ALWAYS = ()
+NEVER = None
+
+
+def bit(value: int) -> int:
+    return 1 << value if value >= 0 else 0
+
+
+def onehot_value(state: tuple, field: int) -> int:
+    # The value a one-hot field holds, the inverse of bit().
+    return state[field].bit_length() - 1
+
+
+def pack_state(
+    weapons_owned,
+    slots_owned,
+    weapon_selected: int,
+    slot_selected: int,
+    session: int,
+    gamemode: int,
+    hudmode: int,
+) -> tuple:
+    weapons = 0
+    for weapon, owned in enumerate(weapons_owned):
+        if owned:
+            weapons |= 1 << weapon
+
+    slots = 0
+    for slot, owned in enumerate(slots_owned):
+        if owned:
+            slots |= 1 << slot
+
+    return (
+        weapons,
+        slots,
+        bit(weapon_selected),
+        bit(slot_selected),
+        bit(session),
+        bit(gamemode),
+        bit(hudmode),
+    )
+
+
+def weapons_matching(predicate) -> int:
+    mask = 0
+    for weapon in range(Weapon.numweapons):
+        if predicate(weapon):
+            mask |= 1 << weapon
+    return mask
+
+
+def slot_mask(param: int) -> int:
+    if 1 <= param <= len(Slots.weapon):
+        return 1 << (Slots.weapon[param - 1] - 1)
+    return 0
+
+
+def compile_conditions(conditions) -> tuple:
+    if conditions is None:
+        return ALWAYS
+
+    # Owned fields: bits that must be set and bits that must be clear.
+    # One-hot fields: the set of values still allowed.
+    owned = [0] * NUMFIELDS
+    notowned = [0] * NUMFIELDS
+    allowed = [-1] * NUMFIELDS
+
+    def require(field: int, mask: int, is_owned: bool):
+        if is_owned:
+            owned[field] |= mask
+        else:
+            notowned[field] |= mask
+
+    def restrict(field: int, mask: int, equal: bool):
+        allowed[field] &= mask if equal else ~mask
+
+    for condition in conditions:
+        cond = condition.condition
+        param = condition.param
+
+        if cond == sbc.weaponowned:
+            if param >= 0 and param < Weapon.numweapons:
+                require(WEAPONS, 1 << param, True)
+
+        elif cond == sbc.weaponselected:
+            restrict(WEAPON_SELECTED, bit(param), True)
+
+        elif cond == sbc.weaponnotselected:
+            restrict(WEAPON_SELECTED, bit(param), False)
+
+        elif cond == sbc.weaponhasammo:
+            if param >= 0 and param < Weapon.numweapons:
+                if Ammo.weapon[param] == Ammo.noammo:
+                    return NEVER
+
+        elif cond == sbc.selectedweaponhasammo:
+            restrict(
+                WEAPON_SELECTED,
+                weapons_matching(lambda w: Ammo.weapon[w] != Ammo.noammo),
+                True,
+            )
+
+        elif cond == sbc.selectedweaponammotype:
+            restrict(
+                WEAPON_SELECTED,
+                weapons_matching(lambda w: Ammo.weapon[w] == param),
+                True,
+            )
+
+        elif cond == sbc.weaponslotowned:
+            require(SLOTS, slot_mask(param), True)
+
+        elif cond == sbc.weaponslotnotowned:
+            require(SLOTS, slot_mask(param), False)
+
+        elif cond == sbc.weaponslotselected:
+            restrict(SLOT_SELECTED, bit(param), True)
+
+        elif cond == sbc.weaponslotnotselected:
+            restrict(SLOT_SELECTED, bit(param), False)
+
+        elif cond == sbc.sessiontypeeequal:
+            restrict(SESSION, bit(param), True)
+
+        elif cond == sbc.sessiontypenotequal:
+            restrict(SESSION, bit(param), False)
+
+        elif cond == sbc.modeeequal:
+            restrict(GAMEMODE, bit(param), True)
+
+        elif cond == sbc.modenotequal:
+            restrict(GAMEMODE, bit(param), False)
+
+        elif cond == sbc.hudmodeequal:
+            restrict(HUDMODE, bit(param), True)
+
+    tests = []
+    for field in range(NUMFIELDS):
+        if field in ONEHOT_FIELDS:
+            if allowed[field] == 0:
+                return NEVER
+            if allowed[field] != -1:
+                tests.append((field, allowed[field], ANY))
+        elif owned[field] & notowned[field]:
+            return NEVER
+        elif owned[field] | notowned[field]:
+            tests.append((field, owned[field] | notowned[field], owned[field]))
+
+    return tuple(tests)
+
+
+def evaluate(tests, state: tuple) -> bool:
+    if tests is NEVER:
+        return False
+
+    for field, mask, want in tests:
+        if want == ANY:
+            if not state[field] & mask:
+                return False
+        elif state[field] & mask != want:
+            return False
+
+    return True
+
+
+def dependencies(tests) -> list:
+    # Game-state inputs a compiled predicate reads: (field, index) for each
+    # owned weapon or slot bit, (field, None) for the one-hot fields.
+    if tests is NEVER:
+        return []
+
+    inputs = []
+    for field, mask, _ in tests:
+        if field in ONEHOT_FIELDS:
+            inputs.append((field, None))
+        else:
+            inputs.extend((field, index) for index in bits(mask))
+    return inputs
+
+
+def state_changes(before: tuple, after: tuple) -> list:
+    inputs = []
+    for field in range(NUMFIELDS):
+        if before[field] == after[field]:
+            continue
+        if field in ONEHOT_FIELDS:
+            inputs.append((field, None))
+        else:
+            inputs.extend((field, index) for index in bits(before[field] ^ after[field]))
+    return inputs
+
+
+def bits(mask: int):
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
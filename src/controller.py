@@ -1,4 +1,4 @@
-import json
+import functools
 from typing import Callable
 
 from PySide6.QtWidgets import (
@@ -6,19 +6,83 @@ from PySide6.QtWidgets import (
     QPushButton,
     QTreeWidgetItem,
     QFileDialog,
-    QStyledItemDelegate,
+    QMessageBox,
     QSpinBox,
 )
-from PySide6.QtCore import Qt, Slot, QPointF
+from PySide6.QtCore import Qt, Slot, QObject, QThread, Signal
+from PySide6.QtGui import QKeySequence, QUndoStack
+
+from commands import AddElementCommand, MoveElementCommand, RemoveElementCommand, SetValueCommand
+from conditions import state_changes
+from preview import TimelinePreview
+from properties import PropertyModel
+import sbardefjson
+import timeline
+
+from sbardef import Graphic, SBarDefError
+from view import SBarCondItem, LumpModel, DrawStats
+
+
+UNDO_LIMIT = 1000
+
+# Player values offered as spin boxes, top to bottom, with their minimum.
+PLAYER_SPINBOXES = (
+    ("Health", "health", 0),
+    ("Armor", "armor", 0),
+    ("Frags", "frags", -99),
+    ("Bullets", "ammo.clip", 0),
+    ("Max bullets", "maxammo.clip", 0),
+    ("Shells", "ammo.shell", 0),
+    ("Max shells", "maxammo.shell", 0),
+    ("Rockets", "ammo.misl", 0),
+    ("Max rockets", "maxammo.misl", 0),
+    ("Cells", "ammo.cell", 0),
+    ("Max cells", "maxammo.cell", 0),
+)
+
 
-from view import SBarCondItem, LumpModel
+class PrepareWorker(QObject):
+    progress = Signal(int, int)
+    finished = Signal(str)  # error message or ""
 
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
 
-class ReadOnlyColumnDelegate(QStyledItemDelegate):
-    def createEditor(self, parent, option, index):
-        if index.column() == 0:
-            return None
-        return super().createEditor(parent, option, index)
+    @Slot()
+    def run(self):
+        # finished must always come, or the next prepare_model() waits on
+        # this thread forever.
+        error = ""
+        try:
+            self.model.prepare(self.progress.emit)
+        except Exception as e:
+            error = str(e)
+        finally:
+            self.finished.emit(error)
+
+
+class SaveWorker(QObject):
+    finished = Signal(str, str)  # path, error message or ""
+
+    def __init__(self, save: Callable, document: dict, path: str):
+        super().__init__()
+        self.save = save
+        self.document = document
+        self.path = path
+
+    @Slot()
+    def run(self):
+        # As in PrepareWorker, finished must always come.
+        error = ""
+        try:
+            self.save(self.document, self.path)
+        except (OSError, ValueError) as e:
+            error = str(e)
+        except Exception as e:
+            error = f"unexpected error: {e!r}"
+        finally:
+            self.finished.emit(self.path, error)
 
 
 class Controller:
@@ -26,6 +90,14 @@ class Controller:
         self.model = model
         self.view = view
         self.barindex = 0
+        self.prepare_thread = None
+        self.save_thread = None
+        self.current_eid = None
+
+        # Commands only hold the values they swap, so a deep stack is cheap.
+        self.undo_stack = QUndoStack()
+        self.undo_stack.setUndoLimit(UNDO_LIMIT)
+        self.undo_sbardef = None
 
         self.win = self.view.main_window
         self.win.ui.comboBox.currentIndexChanged.connect(self.draw_view)
@@ -35,17 +107,39 @@ class Controller:
         self.win.updateScale(200)
         self.win.openJSONFile.connect(self.open_json_file)
         self.win.openWadFile.connect(self.open_wad_file)
+        self.win.clearWadFiles.connect(self.clear_wad_files)
         self.win.saveAsFile.connect(self.save_as_file)
+        self.win.saveIntoWad.connect(self.save_into_wad)
         self.win.showLumps.connect(self.show_lumps)
+        self.win.profileOverlayToggled.connect(self.toggle_profiling)
+        self.win.saveTrace.connect(self.save_trace)
+        self.win.previewToggled.connect(self.toggle_preview)
+        self.win.loadTimeline.connect(self.load_timeline)
+
+        self.preview = TimelinePreview(self.model, self.view)
+        self.preview.statsUpdated.connect(self.show_preview_stats)
+
+        undo_action = self.undo_stack.createUndoAction(self.win, "Undo")
+        undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        redo_action = self.undo_stack.createRedoAction(self.win, "Redo")
+        redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        self.win.ui.menuEdit.addAction(undo_action)
+        self.win.ui.menuEdit.addAction(redo_action)
 
         self.view.lumps_dialog.lumpSelected.connect(self.add_graphic_element)
         self.view.elementRemoved.connect(self.remove_data_element)
+        self.view.elementsMoved.connect(self.move_data_elements)
+        self.view.drawFinished.connect(self.show_draw_stats)
+        self.view.modelPrepared.connect(self.model_prepared)
+        self.view.saveFinished.connect(self.save_finished)
 
+        self.properties = PropertyModel()
+        self.properties.valueEdited.connect(self.update_data_element)
         self.prop = self.view.main_window.ui.treeProp
-        self.prop.setColumnCount(2)
-        self.prop.setHeaderLabels(["Key", "Value"])
-        delegate = ReadOnlyColumnDelegate(self.prop)
-        self.prop.setItemDelegate(delegate)
+        self.prop.setRootIsDecorated(False)
+        self.prop.setModel(self.properties)
+        # After setModel, so this runs once the view has handled the reset.
+        self.properties.modelReset.connect(self.add_conditions_button)
 
         self.cond = self.view.main_window.ui.treeCond
         self.cond.setColumnCount(2)
@@ -65,8 +159,8 @@ class Controller:
         if self.model.sbardef is None:
             return
         
-        for statusbar in self.model.sbardef["data"]["statusbars"]:
-            if statusbar["fullscreenrender"] is True:
+        for statusbar in self.model.sbardef.statusbars:
+            if statusbar.fullscreenrender is True:
                 statusbar_combo.addItem("Fullscreen")
             else:
                 statusbar_combo.addItem("Statusbar")
@@ -91,22 +185,18 @@ class Controller:
         self.cond.insertTopLevelItem(0, item)
         self.cond.setItemWidget(item, 1, combo)
 
-    def populate_spinbox(self, name: str, value: int, callback: Callable):
+    def populate_spinbox(self, name: str, value: int, callback: Callable, minimum: int = 0):
         item = QTreeWidgetItem([name, ""])
         spinbox = QSpinBox()
-        spinbox.setRange(0, 999)
+        spinbox.setRange(minimum, 999)
         spinbox.setValue(value)
         spinbox.valueChanged.connect(callback)
         self.cond.insertTopLevelItem(0, item)
         self.cond.setItemWidget(item, 1, spinbox)
 
-    def update_health(self, value: int):
-        self.model.health = value
-        self.draw_view(self.barindex)
-
-    def update_armor(self, value: int):
-        self.model.armor = value
-        self.draw_view(self.barindex)
+    def update_player(self, field: str, value: int):
+        # Only the numbers showing this field are drawn again.
+        self.view.redraw_elements(self.model.set_player_value(field, value))
 
     def populate_conditions(self):
         index = 0
@@ -122,8 +212,10 @@ class Controller:
             self.cond.insertTopLevelItem(0, item)
             index += 1
 
-        self.populate_spinbox("Health", self.model.health, self.update_health)
-        self.populate_spinbox("Armor", self.model.armor, self.update_armor)
+        for name, field, minimum in reversed(PLAYER_SPINBOXES):
+            self.populate_spinbox(
+                name, self.model.player.get(field), functools.partial(self.update_player, field), minimum
+            )
 
         self.comboWeap = QComboBox()
         self.populate_combo(self.comboWeap, "Selected Weapon", self.model.weapon_items)
@@ -139,33 +231,25 @@ class Controller:
         self.comboGameMode.setCurrentIndex(self.model.gamemode_current)
 
     def update_combo(self):
+        before = self.model.game_state()
+
         self.model.weapon_selected = self.comboWeap.currentIndex()
         self.model.slot_selected = self.comboSlot.currentIndex()
         self.model.session_current = self.comboSession.currentIndex()
         self.model.gamemode_current = self.comboGameMode.currentIndex()
 
-        self.draw_view(self.barindex)
+        self.view.redraw_dependents(state_changes(before, self.model.game_state()))
 
     def update_conditions(self, item: SBarCondItem):
+        before = self.model.game_state()
+
         self.model.conditions[item.cond][1] = (
             1 if item.checkState(1) == Qt.CheckState.Checked else 0
         )
-        self.draw_view(self.barindex)
-
-    def update_elem(self, x: int, y: int, elem: dict):
-        values = next(iter(elem.values()))
-
-        x += values["x"]
-        y += values["y"]
 
-        if "sceneitem" in values:
-            values["sceneitem"].setPos(QPointF(x, y))
+        self.view.redraw_dependents(state_changes(before, self.model.game_state()))
 
-        if values["children"] is not None:
-            for child in values["children"]:
-                self.update_elem(x, y, child)
-
-    def populate_edit_cond(self, elem: dict):
+    def populate_edit_cond(self, elem: list):
         self.editcond.clear()
         item = QTreeWidgetItem([str(elem)])
         self.editcond.insertTopLevelItem(0, item)
@@ -173,138 +257,247 @@ class Controller:
     def launch_cond_dialog(self):
         self.conddlg.exec()
 
-    @Slot(dict)
-    def update_properties(self, elem: dict):
-        self.prop.blockSignals(True)    
-        self.prop.clear()
-
-        for key, value in elem.items():
-            if key != "children":
-                item = QTreeWidgetItem([key, str(value)])
-                if key == "conditions" and value is not None:
-                    button = QPushButton(text="Edit")
-                    self.populate_edit_cond(elem=value)
-                    button.pressed.connect(self.launch_cond_dialog)
-                    self.prop.insertTopLevelItem(0, item)
-                    self.prop.setItemWidget(item, 1, button)
-                    continue
-                
-                item.setFlags(item.flags() | Qt.ItemIsEditable)
-                self.prop.insertTopLevelItem(0, item)
-        
-        self.prop.blockSignals(False)
-
-        @Slot(QTreeWidgetItem, int)
-        def property_changed_handler(item, column):
-            if column != 1:
-                return
-
-            key = item.text(0)
-            new_value_str = item.text(1)
-            old_value = elem.get(key)
-
-            if isinstance(old_value, bool):
-                new_value = new_value_str.lower() in ('true', '1', 'yes')
-            elif isinstance(old_value, int):
-                new_value = int(new_value_str)
-            elif isinstance(old_value, float):
-                new_value = float(new_value_str)
-            elif old_value is None:
-                new_value = None if new_value_str.lower() == 'none' else new_value_str
-            else:
-                new_value = new_value_str
-
-            if new_value != old_value:
-                self.update_data_element(elem, key, new_value)
-
-        self.prop.itemChanged.connect(property_changed_handler)
+    @Slot(int)
+    def update_properties(self, eid: int):
+        self.current_eid = eid
+        self.properties.set_element(eid, self.model.elements[eid].elem)
 
-        if elem["children"] is not None:
-            x = elem["x"]
-            y = elem["y"]
-            for child in elem["children"]:
-                self.update_elem(x, y, child)
+    def add_conditions_button(self):
+        # Index widgets go away with every reset, so each selection gets a
+        # fresh button and nothing stays connected to an old element.
+        elem = self.properties.elem
+        if elem is None or elem.conditions is None or "conditions" not in self.properties.keys:
+            return
+        self.populate_edit_cond(elem=elem.conditions)
+        button = QPushButton(text="Edit")
+        button.pressed.connect(self.launch_cond_dialog)
+        row = self.properties.keys.index("conditions")
+        self.prop.setIndexWidget(self.properties.index(row, 1), button)
 
     def draw_view(self, barindex: int):
         self.barindex = barindex
         self.view.draw(barindex, self.update_properties)
 
+    def show_draw_stats(self, stats: DrawStats):
+        if self.preview.running:
+            return
+        self.win.statusBar().showMessage(
+            f"diff {stats.diff_ms:.1f} ms, apply {stats.apply_ms:.1f} ms "
+            f"(+{stats.added} -{stats.removed} ~{stats.updated})"
+        )
+
     def open_json_file(self):
         fileName, _ = QFileDialog.getOpenFileName(self.view.main_window, "Open JSON file", "", "JSON files (*.json)")
         if fileName:
-            self.model.load_json(fileName)
-            self.populate_statusbar_combo()
-            self.draw_view(0)
+            try:
+                self.model.load_json(fileName)
+            except (OSError, SBarDefError) as e:
+                self.show_load_error(fileName, e)
+                return
+            self.document_loaded()
+            self.prepare_model()
 
     def open_wad_file(self):
         fileName, _ = QFileDialog.getOpenFileName(self.view.main_window, "Open WAD file", "", "WAD files (*.wad)")
         if fileName:
-            self.model.load_wad(fileName)
-            self.populate_statusbar_combo()
-            self.draw_view(0)
+            try:
+                self.model.add_wad(fileName)
+            except SBarDefError as e:
+                # The WAD's graphics are loaded; only its SBARDEF is skipped.
+                self.show_load_error(fileName, e)
+            except (OSError, ValueError) as e:
+                # Not a WAD, or a truncated one.
+                self.show_load_error(fileName, e)
+                return
+            self.document_loaded()
+            self.prepare_model()
+
+    def document_loaded(self):
+        # The model swaps the document in as soon as it is loaded, long
+        # before prepare finishes; nothing recorded against the old one's
+        # elements may run on the new one meanwhile.
+        if self.model.sbardef is self.undo_sbardef:
+            return
+        self.undo_stack.clear()
+        self.undo_sbardef = self.model.sbardef
+        self.current_eid = None
+        self.properties.clear()
+        # The scene's items and layout hold the old document's elements.
+        self.view.clear_scene()
+
+    def show_load_error(self, path: str, error: Exception):
+        QMessageBox.warning(self.win, "Open failed", f"Could not load {path}:\n{error}")
+
+    def clear_wad_files(self):
+        # The prepare worker reads the resources being cleared.
+        if self.prepare_thread is not None:
+            self.prepare_thread.wait()
+        self.view.lumps_dialog.setModel(LumpModel({}, self.model.load_thumbnail))
+        self.model.clear_resources()
+        self.prepare_model()
+
+    def prepare_model(self):
+        # Decode fonts and referenced patches off the GUI thread, then draw.
+        if self.prepare_thread is not None:
+            self.prepare_thread.wait()
+
+        self.preview.stop()
+        self.win.ui.actionPreview.setChecked(False)
+
+        thread = QThread()
+        worker = PrepareWorker(self.model)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.progress.connect(self.view.show_progress)
+        # Quit from the worker thread itself, so wait() on the GUI thread
+        # returns without the event loop running.
+        worker.finished.connect(thread.quit, Qt.DirectConnection)
+        # Relayed through the view so the slot runs on the GUI thread.
+        worker.finished.connect(self.view.modelPrepared)
+
+        self.prepare_thread = thread
+        self.prepare_worker = worker
+        thread.start()
+
+    def model_prepared(self, error: str):
+        if self.prepare_thread is not None:
+            self.prepare_thread.wait()
+        self.prepare_thread = None
+        self.prepare_worker = None
+
+        self.view.show_progress(0, 0)
+        if error:
+            QMessageBox.warning(self.win, "Prepare failed", f"Could not prepare the status bar graphics:\n{error}")
+
+        self.document_loaded()
+        self.populate_statusbar_combo()
+        self.draw_view(0)
 
     def save_as_file(self):
         fileName, _ = QFileDialog.getSaveFileName(self.view.main_window, "Save SBARDEF as...", "", "JSON files (*.json)")
         if fileName:
-            with open(fileName, 'w') as f:
-                json.dump(self.model.sbardef, f, indent=2)
+            self.start_save(sbardefjson.save, fileName)
+
+    def save_into_wad(self):
+        # Starts in the WAD the SBARDEF came from, when there is one.
+        lump = self.model.resources.find("SBARDEF")
+        start = lump.wad.path if lump is not None else ""
+        fileName, _ = QFileDialog.getOpenFileName(self.view.main_window, "Save SBARDEF into WAD", start, "WAD files (*.wad)")
+        if fileName:
+            self.start_save(sbardefjson.save_into_wad, fileName)
+
+    def start_save(self, save: Callable, path: str):
+        if self.model.sbardef is None:
+            return
+        if self.save_thread is not None:
+            self.save_thread.wait()
+
+        # Encoding and writing happen on the worker; the snapshot keeps
+        # edits made meanwhile out of the file being written.
+        thread = QThread()
+        worker = SaveWorker(save, self.model.sbardef.to_json(), path)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.finished.connect(thread.quit, Qt.DirectConnection)
+        worker.finished.connect(self.view.saveFinished)
+
+        self.save_thread = thread
+        self.save_worker = worker
+        thread.start()
+
+    def save_finished(self, path: str, error: str):
+        if self.save_thread is not None:
+            self.save_thread.wait()
+        self.save_thread = None
+        self.save_worker = None
+
+        if error:
+            QMessageBox.warning(self.win, "Save failed", f"Could not save {path}:\n{error}")
+        else:
+            # A WAD in the resource stack has a new directory now.
+            self.model.reload_wad(path)
+            self.win.statusBar().showMessage(f"Saved {path}", 5000)
+
+    def toggle_profiling(self, enabled: bool):
+        if enabled:
+            self.model.profiler.enable(trace=True)
+        else:
+            self.model.profiler.disable()
+        self.view.set_overlay(enabled)
+
+    def save_trace(self):
+        fileName, _ = QFileDialog.getSaveFileName(self.win, "Save profile trace", "", "Trace files (*.json)")
+        if fileName:
+            try:
+                self.model.profiler.dump_trace(fileName)
+            except OSError as e:
+                QMessageBox.warning(self.win, "Save failed", f"Could not save {fileName}:\n{e}")
+
+    def toggle_preview(self, enabled: bool):
+        if enabled:
+            self.preview.start()
+        elif self.preview.running:
+            self.preview.stop()
+            self.draw_view(self.barindex)
+
+    def show_preview_stats(self, stats: dict):
+        self.win.statusBar().showMessage(
+            f"tic {stats['tics']}: {stats['mean_ms']:.2f} ms mean, {stats['p95_ms']:.2f} ms p95, "
+            f"{stats['max_ms']:.2f} ms max, {stats['late']} late, {stats['dropped']} dropped, "
+            f"{stats['redrawn_per_tic']:.1f} redrawn per tic"
+        )
+
+    def load_timeline(self):
+        fileName, _ = QFileDialog.getOpenFileName(self.win, "Load timeline", "", "Timeline files (*.json)")
+        if fileName:
+            try:
+                loaded = timeline.load(fileName)
+            except (OSError, ValueError) as e:
+                self.show_load_error(fileName, e)
+                return
+            self.preview.set_timeline(loaded)
 
     def show_lumps(self):
         lumps = self.model.lumps
         if lumps:
-            model = LumpModel(lumps)
+            model = LumpModel(lumps, self.model.load_thumbnail)
             self.view.lumps_dialog.setModel(model)
         self.view.lumps_dialog.show()
 
     def add_graphic_element(self, lump_name):
-        new_element = {
-            "graphic": {
-                "x": 0,
-                "y": 0,
-                "patch": lump_name,
-                "alignment": 0,
-                "conditions": None,
-                "children": None
-            }
-        }
-
-        statusbar = self.model.sbardef["data"]["statusbars"][self.barindex]
-        if statusbar["children"] is None:
-            statusbar["children"] = []
-        statusbar["children"].append(new_element)
-
-        self.draw_view(self.barindex)
-
-    def remove_data_element(self, elem_data: dict):
-
-        def find_and_remove(parent, elem_to_remove):
-            if "children" in parent and parent["children"] is not None:
-                for i, child in enumerate(parent["children"]):
-                    elem = next(iter(child.values()))
-                    if elem == elem_to_remove:
-                        del parent["children"][i]
-                        return True
-                    if find_and_remove(elem, elem_to_remove):
-                        return True
-            return False
-
-        find_and_remove(self.model.sbardef["data"]["statusbars"][self.barindex], elem_data)
-
-        self.draw_view(self.barindex)
-
-    def update_data_element(self, elem_data: dict, key: str, value):
-
-        def find_and_update(parent, elem_to_update):
-            if "children" in parent and parent["children"] is not None:
-                for i, child in enumerate(parent["children"]):
-                    elem = next(iter(child.values()))
-                    if elem == elem_to_update:
-                        elem[key] = value
-                        return True
-                    if find_and_update(elem, elem_to_update):
-                        return True
-            return False
-
-        find_and_update(self.model.sbardef["data"]["statusbars"][self.barindex], elem_data)
-
-        self.draw_view(self.barindex)
+        new_element = Graphic(
+            x=0,
+            y=0,
+            patch=lump_name,
+            alignment=0,
+            conditions=None,
+            children=None,
+        )
+
+        self.undo_stack.push(AddElementCommand(self, self.barindex, new_element))
+
+    def remove_data_element(self, eid: int):
+        self.undo_stack.push(RemoveElementCommand(self, eid))
+
+    def update_data_element(self, eid: int, key: str, value):
+        self.undo_stack.push(SetValueCommand(self, eid, key, value))
+
+    def move_data_elements(self, positions: dict, drag: int):
+        self.undo_stack.push(MoveElementCommand(self, positions, drag))
+
+    def element_changed(self, eid: int):
+        self.elements_changed([eid])
+
+    def elements_changed(self, ids):
+        self.view.redraw_elements(ids)
+        if self.current_eid in ids:
+            self.properties.refresh()
+
+    def element_added(self, eid: int):
+        self.view.redraw_elements([eid])
+
+    def elements_removed(self, ids: list):
+        self.view.redraw_elements((), ids)
+        if self.current_eid in ids:
+            self.current_eid = None
+            self.properties.clear()
@@ -0,0 +1,79 @@
+import os
+import struct
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
+import omg.palette
+from PIL import Image
+
+from keying import key_to_alpha
+
+
+def decode_patch(data: bytes, palette=omg.palette.default) -> Image.Image:
+    # Same output as omg's Graphic.to_Image(): a paletted image with
+    # transparent pixels set to the palette's transparency index. Posts are
+    # copied with slice assignment into a column-major buffer, which is then
+    # transposed, instead of walking pixels one by one.
+    width, height = struct.unpack_from("<hh", data, 0)
+    if width <= 0 or height <= 0:
+        raise ValueError("patch has no pixels")
+
+    pointers = struct.unpack_from(f"<{width}i", data, 8)
+    columns = bytearray([palette.tran_index]) * (width * height)
+
+    for x, pointer in enumerate(pointers):
+        column = x * height
+        y = -1
+        while pointer < len(data) and data[pointer] != 0xFF:
+            offset = data[pointer]
+            if offset <= y:
+                y += offset  # tall patches
+            else:
+                y = offset
+            length = data[pointer + 1]
+            count = max(0, min(length, height - y))
+            if count > 0:
+                start = pointer + 3
+                columns[column + y : column + y + count] = data[start : start + count]
+            pointer += length + 4
+
+    image = Image.frombytes("P", (height, width), bytes(columns))
+    image = image.transpose(Image.Transpose.TRANSPOSE)
+    image.putpalette(palette.save_bytes)
+    return image
+
+
+def decode_keyed(data: bytes) -> Image.Image:
+    return key_to_alpha(decode_patch(data))
+
+
+def decode_all(
+    lumps: dict,
+    progress: Callable = None,
+    max_workers: int = None,
+    decode: Callable = None,
+) -> dict:
+    # Decodes and keys every lump on a thread pool. Pillow releases the GIL
+    # for the buffer work, and the per-post loop above is short. A custom
+    # decode(lump) can serve some lumps from elsewhere first.
+    images = {}
+    total = len(lumps)
+    done = 0
+
+    if decode is None:
+        decode = lambda lump: decode_keyed(lump.data)
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {executor.submit(decode, lump): name for name, lump in lumps.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                images[name] = future.result()
+            except Exception as e:
+                print(f"Could not decode lump {name}: {e}")
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+    return images
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+from PIL import Image
+
+# Each entry is one file: a fixed header, optional JSON metadata, then the
+# raw RGBA pixels at a 16-byte aligned offset, so a hit maps the file and
+# wraps the pixels without copying or decoding them.
+MAGIC = b"I24C"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIII")  # magic, version, reserved, width, height, metadata size
+ALIGN = 16
+SUFFIX = ".rgba"
+
+
+def user_cache_dir(appname: str = "id24editor") -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, appname)
+
+
+def lump_key(lump) -> str:
+    # The WAD's path, size and mtime go into the key along with the lump's
+    # content hash, so an edited WAD never reads back stale pixels.
+    wad = lump.wad
+    return cache_key(os.path.abspath(wad.path), wad.size, wad.mtime, lump.name, lump.content_hash().hex())
+
+
+def cache_key(*parts) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, path: str, budget: int = 256 * 1024 * 1024):
+        self.path = path
+        self.budget = budget
+        self.size = 0
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.endswith(SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    self.entries[entry.name] = (stat.st_size, stat.st_mtime)
+                    self.size += stat.st_size
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.path, key + SUFFIX)
+
+    def get(self, key: str) -> tuple:
+        # Returns (image, metadata) or None. The image shares memory with
+        # the mapped file and is read-only.
+        filename = self.filename(key)
+        try:
+            with open(filename, "rb") as file:
+                view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, version, _, width, height, metasize = HEADER.unpack_from(view, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("unknown cache entry format")
+
+            start = HEADER.size
+            metadata = json.loads(view[start : start + metasize]) if metasize else None
+
+            offset = align(start + metasize)
+            if offset + width * height * 4 != len(view):
+                raise ValueError("truncated cache entry")
+
+            image = Image.frombuffer(
+                "RGBA", (width, height), memoryview(view)[offset:], "raw", "RGBA", 0, 1
+            )
+        except (ValueError, struct.error):
+            view.close()
+            self.discard(key)
+            return None
+
+        self.touch(key)
+        return image, metadata
+
+    def put(self, key: str, image: Image.Image, metadata: dict = None):
+        image = image if image.mode == "RGBA" else image.convert("RGBA")
+        meta = json.dumps(metadata).encode() if metadata is not None else b""
+
+        header = HEADER.pack(MAGIC, VERSION, 0, image.width, image.height, len(meta))
+        padding = bytes(align(len(header) + len(meta)) - len(header) - len(meta))
+        data = header + meta + padding + image.tobytes()
+
+        # Written beside the target and renamed over it, so a crash or a
+        # second process never leaves a half-written entry behind.
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(temp, self.filename(key))
+        except OSError:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+
+        with self.lock:
+            name = key + SUFFIX
+            if name in self.entries:
+                self.size -= self.entries[name][0]
+            self.entries[name] = (len(data), os.path.getmtime(self.filename(key)))
+            self.size += len(data)
+        self.evict()
+
+    def touch(self, key: str):
+        # Hits refresh the mtime, which eviction uses as the last-use time.
+        name = key + SUFFIX
+        try:
+            os.utime(self.filename(key))
+        except OSError:
+            return
+        with self.lock:
+            if name in self.entries:
+                self.entries[name] = (self.entries[name][0], os.path.getmtime(self.filename(key)))
+
+    def discard(self, key: str):
+        name = key + SUFFIX
+        try:
+            os.remove(self.filename(key))
+        except OSError:
+            pass
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is not None:
+                self.size -= entry[0]
+
+    def evict(self):
+        with self.lock:
+            if self.size <= self.budget:
+                return
+            oldest = sorted(self.entries.items(), key=lambda item: item[1][1])
+
+        for name, (size, _) in oldest:
+            if self.size <= self.budget:
+                break
+            self.discard(name[: -len(SUFFIX)])
+
+    def clear(self):
+        for name in list(self.entries):
+            self.discard(name[: -len(SUFFIX)])
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.size, "budget": self.budget}
+
+
+def align(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
@@ -0,0 +1,101 @@
+from sbardef import Element
+
+
+class ElementRef:
+    __slots__ = ("id", "parent", "index", "elem")
+
+    def __init__(self, eid: int, parent, index: int, elem: Element):
+        self.id = eid
+        self.parent = parent  # statusbar or parent element
+        self.index = index  # position in parent.children
+        self.elem = elem
+
+    @property
+    def type(self) -> str:
+        return self.elem.kind
+
+
+class ElementTable:
+    def __init__(self):
+        self.refs = {}
+        self.by_elem = {}
+        self.next_id = 1
+
+    def load(self, statusbars: list):
+        self.refs = {}
+        self.by_elem = {}
+        self.next_id = 1
+        for statusbar in statusbars:
+            self.add_children(statusbar)
+
+    def add_children(self, parent, ids=None):
+        if parent.children is not None:
+            for index, elem in enumerate(parent.children):
+                self.add(parent, index, elem, ids)
+
+    def add(self, parent, index: int, elem: Element, ids=None) -> int:
+        # ids, when given, yields the IDs to use in subtree order, so a
+        # subtree that was removed comes back under the IDs it had.
+        eid = next(ids) if ids is not None else self.next_id
+        self.next_id = max(self.next_id, eid + 1)
+
+        ref = ElementRef(eid, parent, index, elem)
+        self.refs[eid] = ref
+        self.by_elem[id(elem)] = eid
+        self.add_children(elem, ids)
+        return eid
+
+    def insert(self, parent, index: int, elem: Element, ids: list = None) -> int:
+        if parent.children is None:
+            parent.children = []
+        parent.children.insert(index, elem)
+        self.reindex(parent, index + 1)
+        return self.add(parent, index, elem, iter(ids) if ids is not None else None)
+
+    def remove(self, eid: int) -> ElementRef:
+        ref = self.refs[eid]
+        del ref.parent.children[ref.index]
+        self.reindex(ref.parent, ref.index)
+        for child in self.subtree(eid):
+            del self.by_elem[id(self.refs.pop(child).elem)]
+        return ref
+
+    def move(self, eid: int, parent, index: int):
+        ref = self.refs[eid]
+        del ref.parent.children[ref.index]
+        self.reindex(ref.parent, ref.index)
+
+        if parent.children is None:
+            parent.children = []
+        parent.children.insert(index, ref.elem)
+        ref.parent = parent
+        ref.index = index
+        self.reindex(parent, index + 1)
+
+    def reindex(self, parent, start: int):
+        for index in range(start, len(parent.children)):
+            self.lookup(parent.children[index]).index = index
+
+    def lookup(self, elem: Element) -> ElementRef:
+        return self.refs[self.by_elem[id(elem)]]
+
+    def id_of(self, elem: Element) -> int:
+        return self.by_elem[id(elem)]
+
+    def subtree(self, eid: int) -> list:
+        ids = [eid]
+        children = self.refs[eid].elem.children
+        if children is not None:
+            for child in children:
+                ids.extend(self.subtree(self.id_of(child)))
+        return ids
+
+    def __getitem__(self, eid: int) -> ElementRef:
+        return self.refs[eid]
+
+    def __contains__(self, eid: int) -> bool:
+        return eid in self.refs
+
+    def __iter__(self):
+        return iter(self.refs.values())
+
@@ -0,0 +1,51 @@
+from PIL import Image, ImageChops
+
+# omgifol paints transparent patch pixels with this colour when converting to
+# a PIL image (see omg.palette.default_tran_color).
+KEY_COLORS = ((255, 0, 255),)
+
+
+def key_to_alpha(image: Image.Image, key_colors=KEY_COLORS) -> Image.Image:
+    if image.mode == "P":
+        return key_palette(image, key_colors)
+    return key_bands(image, key_colors)
+
+
+def key_palette(image: Image.Image, key_colors=KEY_COLORS) -> Image.Image:
+    # Build the alpha band from palette indices before the RGBA conversion:
+    # one 256-entry translation table instead of a per-pixel comparison.
+    keys = set(key_colors)
+    palette = image.getpalette() or []
+    table = bytearray(b"\xff" * 256)
+    for index in range(len(palette) // 3):
+        if tuple(palette[index * 3 : index * 3 + 3]) in keys:
+            table[index] = 0
+
+    alpha = Image.frombytes("L", image.size, image.tobytes().translate(table))
+
+    rgba = image.convert("RGBA")
+    if "transparency" in image.info:
+        alpha = ImageChops.darker(alpha, rgba.getchannel("A"))
+    rgba.putalpha(alpha)
+
+    return rgba
+
+
+def key_bands(image: Image.Image, key_colors=KEY_COLORS) -> Image.Image:
+    rgba = image.convert("RGBA")
+    r, g, b, alpha = rgba.split()
+
+    for key_r, key_g, key_b in key_colors:
+        mask = ImageChops.multiply(
+            ImageChops.multiply(band_equal(r, key_r), band_equal(g, key_g)),
+            band_equal(b, key_b),
+        )
+        alpha = ImageChops.subtract(alpha, mask)
+
+    rgba.putalpha(alpha)
+
+    return rgba
+
+
+def band_equal(band: Image.Image, value: int) -> Image.Image:
+    return band.point([255 if i == value else 0 for i in range(256)])
@@ -0,0 +1,142 @@
+import bisect
+
+from collections import defaultdict
+from typing import NamedTuple
+
+# Lump names are at most eight characters, so indexing every substring of
+# up to three characters answers short queries exactly and lets longer
+# ones start from the intersection of their trigrams.
+GRAM_SIZE = 3
+
+
+class LumpQuery(NamedTuple):
+    # A leading "^" matches at the start of the name, otherwise anywhere.
+    # Empty namespaces and zero sizes mean no restriction.
+    text: str = ""
+    namespaces: frozenset = frozenset()
+    max_width: int = 0
+    max_height: int = 0
+
+    def narrows(self, other: "LumpQuery") -> bool:
+        # True when every lump matching self also matches other, so self can
+        # be answered by filtering other's result.
+        if other.text.startswith("^"):
+            if not self.text.startswith(other.text):
+                return False
+        elif other.text not in self.text.removeprefix("^"):
+            return False
+
+        if other.namespaces and not (self.namespaces and self.namespaces <= other.namespaces):
+            return False
+
+        return within(self.max_width, other.max_width) and within(self.max_height, other.max_height)
+
+
+def within(limit: int, other: int) -> bool:
+    return other == 0 or (limit != 0 and limit <= other)
+
+
+class LumpIndex:
+    def __init__(self, lumps: dict):
+        self.lumps = lumps
+        self.names = list(lumps)
+        self.sorted = sorted((name, row) for row, name in enumerate(self.names))
+        self.sorted_names = [name for name, _ in self.sorted]
+        self.dimensions = None
+        self.last = None
+
+        # Posting lists are appended in row order, so they stay sorted and a
+        # repeated gram within one name only needs a check against the end.
+        self.grams = defaultdict(list)
+        self.namespaces = {}
+        for row, name in enumerate(self.names):
+            for gram in name_grams(name):
+                posting = self.grams[gram]
+                if not posting or posting[-1] != row:
+                    posting.append(row)
+            namespace = getattr(lumps[name], "namespace", None)
+            self.namespaces.setdefault(namespace, set()).add(row)
+
+    def search(self, query: LumpQuery) -> list[int]:
+        text = query.text.upper()
+        query = query._replace(text="" if text == "^" else text)
+
+        if self.last is not None and query.narrows(self.last[0]):
+            rows = self.filter(self.last[1], query)
+        else:
+            rows = sorted(self.filter(self.candidates(query), query))
+
+        self.last = (query, rows)
+        return rows
+
+    def candidates(self, query: LumpQuery):
+        text = query.text
+        if text.startswith("^"):
+            prefix = text[1:]
+            start = bisect.bisect_left(self.sorted_names, prefix)
+            end = bisect.bisect_left(self.sorted_names, prefix + "\uffff")
+            return [row for _, row in self.sorted[start:end]]
+
+        if not text:
+            if query.namespaces:
+                return set().union(*(self.namespaces.get(namespace, ()) for namespace in query.namespaces))
+            return range(len(self.names))
+
+        if len(text) <= GRAM_SIZE:
+            return self.grams.get(text, [])
+
+        postings = []
+        for i in range(len(text) - GRAM_SIZE + 1):
+            posting = self.grams.get(text[i : i + GRAM_SIZE])
+            if posting is None:
+                return ()
+            postings.append(posting)
+        postings.sort(key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def filter(self, rows, query: LumpQuery) -> list[int]:
+        # Candidates are a superset of the answer; check what the index
+        # alone could not decide.
+        names = self.names
+        text = query.text
+        if text.startswith("^"):
+            rows = [row for row in rows if names[row].startswith(text[1:])]
+        elif text:
+            rows = [row for row in rows if text in names[row]]
+        else:
+            rows = list(rows)
+
+        if query.namespaces:
+            allowed = set()
+            for namespace in query.namespaces:
+                allowed |= self.namespaces.get(namespace, set())
+            rows = [row for row in rows if row in allowed]
+
+        if query.max_width or query.max_height:
+            dimensions = self.load_dimensions()
+            max_width = query.max_width or 0x7FFF
+            max_height = query.max_height or 0x7FFF
+            rows = [
+                row
+                for row in rows
+                if dimensions[row][0] <= max_width and dimensions[row][1] <= max_height
+            ]
+
+        return rows
+
+    def load_dimensions(self) -> list:
+        # Read from the lump headers the first time a size filter is used.
+        if self.dimensions is None:
+            self.dimensions = []
+            for name in self.names:
+                try:
+                    self.dimensions.append(self.lumps[name].dimensions)
+                except Exception:
+                    self.dimensions.append((0x7FFF, 0x7FFF))
+        return self.dimensions
+
+
+def name_grams(name: str):
+    for i in range(len(name)):
+        for size in range(1, min(GRAM_SIZE, len(name) - i) + 1):
+            yield name[i : i + size]
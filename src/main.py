@@ -1,6 +1,7 @@
 import sys
 from PySide6.QtWidgets import QApplication
 
+from diskcache import DiskCache, user_cache_dir
 from model import SBarModel
 from view import View
 from controller import Controller
@@ -8,7 +9,7 @@ from controller import Controller
 if __name__ == "__main__":
     app = QApplication(sys.argv)
 
-    model = SBarModel()
+    model = SBarModel(DiskCache(user_cache_dir()))
     view = View(model)
     controller = Controller(model, view)
 
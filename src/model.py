@@ -1,26 +1,41 @@
-import json
-import omg
+import hashlib
+
+from collections import OrderedDict
+from typing import Callable
 
 from PIL import Image
 
-from doomdata import (
-    Ammo,
-    Weapon,
-    Slots,
-    Session,
-    GameMode,
-    sbc
-)
+from conditions import compile_conditions, dependencies, evaluate, pack_state
+from elements import ElementRef, ElementTable
+from decode import decode_all, decode_keyed
+from diskcache import DiskCache, cache_key, lump_key
+from patchcache import PatchCache
+from playerstate import WEAPON_INPUT, PlayerState, number_inputs
+from profiling import Profiler
+from sbardef import Element, SBarDefError
+from resources import ResourceStack
+from doomdata import Weapon, Session, GameMode
 
 
 class SBarModel:
-    def __init__(self):
-        self.wad = omg.WAD()
+    def __init__(self, disk_cache: DiskCache = None):
+        self.resources = ResourceStack()
+        self.disk_cache = disk_cache
         self.sbardef = None
-        self.lumps = None
+        self.lumps = self.resources.graphics
         self.numberfonts = []
-        self.health = 100
-        self.armor = 0
+        self.elements = ElementTable()
+        self.predicates = {}
+        self.dependents = {}
+        # Number elements by the inputs they show, and the other way round.
+        self.subscribers = {}
+        self.subscriptions = {}
+        self.patch_cache = PatchCache()
+        self.image_cache = PatchCache()
+        # Cache keys of patches prepare() could not decode.
+        self.undecodable = set()
+        self.profiler = Profiler()
+        self.player = PlayerState()
 
         self.weapon_items = [
             ["First", 1],
@@ -64,152 +79,437 @@ class SBarModel:
             + self.other_items
         )
 
-        self.weapon_selected = Weapon.pistol
+        self.selected_weapon = Weapon.pistol
         self.slot_selected = 1
         self.session_current = Session.singleplayer
         self.gamemode_current = GameMode.commercial
 
     def load_wad(self, path: str):
-        self.wad.from_file(path)
-        self.lumps = self.wad.graphics + self.wad.patches + self.wad.sprites
-        if "SBARDEF" in self.wad.data:
-            self.sbardef = json.loads(self.wad.data["SBARDEF"].data)
-            self.load_fonts()
-
-    def load_json(self, path: str):
-        with open(path, 'r') as file:
-            self.sbardef = json.load(file)
-            self.load_fonts()
-
-    def load_fonts(self):
-        self.numberfonts = []
-
-        for numberfont in self.sbardef["data"]["numberfonts"]:
-            font = NumberFont(numberfont["name"])
-            stem = numberfont["stem"]
-
-            for num in range(0, 10):
-                name = stem + "NUM" + str(num)
-                if name in self.lumps:
-                    font.add_number(self.lumps[name].to_Image())
-
-            name = stem + "MINUS"
-            if name in self.lumps:
-                font.add_minus(self.lumps[name].to_Image())
-
-            name = stem + "PRCNT"
-            if name in self.lumps:
-                font.add_percent(self.lumps[name].to_Image())
-
-            self.numberfonts.append(font)
-
-    def check_conditions(self, elem: dict) -> bool:
-        result = True
-        if elem["conditions"] is not None:
-            for condition in elem["conditions"]:
-                cond = condition["condition"]
-                param = condition["param"]
-
-                if cond == sbc.weaponowned:
-                    if param >= 0 and param < Weapon.numweapons:
-                        result &= self.weapon_items[param][1]
+        self.resources.clear()
+        self.add_wad(path)
 
-                elif cond == sbc.weaponselected:
-                    result &= self.weapon_selected == param
+    def add_wad(self, path: str):
+        with self.profiler.phase("load.wad"):
+            wad = self.resources.add_wad(path)
+            self.lumps = self.resources.graphics
 
-                elif cond == sbc.weaponnotselected:
-                    result &= self.weapon_selected != param
+        # A loose JSON file stays on top of the stack; otherwise the newest
+        # WAD that carries an SBARDEF wins.
+        if self.resources.json_path is None and wad.find("SBARDEF") is not None:
+            with self.profiler.phase("load.sbardef"):
+                self.sbardef = self.resources.load_sbardef()
+            self.load_elements()
 
-                elif cond == sbc.weaponhasammo:
-                    if param >= 0 and param < Weapon.numweapons:
-                        result &= Ammo.weapon[param] != Ammo.noammo
+    def reload_wad(self, path: str):
+        if self.resources.reload_wad(path):
+            self.lumps = self.resources.graphics
 
-                elif cond == sbc.selectedweaponhasammo:
-                    result &= Ammo.weapon[self.weapon_selected] != Ammo.noammo
-
-                elif cond == sbc.selectedweaponammotype:
-                    result &= Ammo.weapon[self.weapon_selected] == param
-
-                elif cond == sbc.weaponslotowned:
-                    result &= self.slot_items[Slots.weapon[param - 1] - 1][1]
-
-                elif cond == sbc.weaponslotnotowned:
-                    result &= not self.slot_items[Slots.weapon[param - 1] - 1][1]
-
-                elif cond == sbc.weaponslotselected:
-                    result &= self.slot_selected == param
-
-                elif cond == sbc.weaponslotnotselected:
-                    result &= self.slot_selected != param
+    def load_json(self, path: str):
+        previous = self.resources.json_path
+        self.resources.set_json(path)
+        try:
+            with self.profiler.phase("load.sbardef"):
+                sbardef = self.resources.load_sbardef()
+        except (OSError, SBarDefError):
+            self.resources.set_json(previous)
+            raise
+        self.sbardef = sbardef
+        self.load_elements()
+
+    def clear_resources(self):
+        self.resources.clear_wads()
+        self.lumps = self.resources.graphics
+
+    def prepare(self, progress: Callable = None, max_workers: int = None):
+        # Decodes everything the SBARDEF references up front; safe to run
+        # off the GUI thread.
+        with self.profiler.phase("prepare.patches"):
+            self.warm_patches(progress, max_workers)
+        if self.sbardef is not None:
+            with self.profiler.phase("prepare.fonts"):
+                self.load_fonts()
+
+    def referenced_patches(self) -> dict:
+        names = set()
+
+        if self.sbardef is not None:
+            for numberfont in self.sbardef.numberfonts:
+                stem = numberfont.stem
+                names.update(stem + "NUM" + str(num) for num in range(0, 10))
+                names.update((stem + "MINUS", stem + "PRCNT"))
+
+            for ref in self.elements:
+                if ref.type == "graphic":
+                    names.add(ref.elem.patch)
+                elif ref.type == "face":
+                    names.add("STFST00")
+
+        return {name: self.lumps[name] for name in names if name in self.lumps}
+
+    def warm_patches(self, progress: Callable = None, max_workers: int = None):
+        missing = {
+            name: lump
+            for name, lump in self.referenced_patches().items()
+            if PatchCache.key(name, lump) not in self.image_cache
+            and PatchCache.key(name, lump) not in self.undecodable
+        }
+        self.profiler.count("prepare.decoded", len(missing))
+        images = decode_all(missing, progress, max_workers, self.load_patch)
+        for name, lump in missing.items():
+            key = PatchCache.key(name, lump)
+            if name in images:
+                self.image_cache.put(key, images[name], image_nbytes(images[name]))
+            else:
+                self.undecodable.add(key)
+
+    def patch_image(self, name: str, lump):
+        return self.image_cache.get(
+            PatchCache.key(name, lump),
+            lambda: self.load_patch(lump),
+            image_nbytes,
+        )
 
-                elif cond == sbc.sessiontypeeequal:
-                    result &= self.session_current == param
+    def load_patch(self, lump):
+        # A disk cache hit maps the keyed pixels from a previous session.
+        if self.disk_cache is None:
+            with self.profiler.phase("load.decode"):
+                return decode_keyed(lump.data)
+
+        key = lump_key(lump)
+        cached = self.disk_cache.get(key)
+        if cached is not None:
+            self.profiler.count("disk.hits")
+            return cached[0]
+
+        self.profiler.count("disk.misses")
+        with self.profiler.phase("load.decode"):
+            image = decode_keyed(lump.data)
+        self.disk_cache.put(key, image)
+        return image
 
-                elif cond == sbc.sessiontypenotequal:
-                    result &= self.session_current != param
+    def decoded_patch(self, name: str, lump):
+        # None for a patch that cannot be decoded; it is remembered, so it is
+        # not tried again on every draw.
+        key = PatchCache.key(name, lump)
+        if key in self.undecodable:
+            return None
+        try:
+            return self.patch_image(name, lump)
+        except Exception as e:
+            print(f"Could not decode lump {name}: {e}")
+            self.undecodable.add(key)
+            return None
+
+    def load_thumbnail(self, lump):
+        # Lumps browsed in the lumps dialog bypass the disk cache, so they
+        # don't evict the graphics status bars are drawn from.
+        return decode_keyed(lump.data)
+
+    def glyph_image(self, name: str):
+        lump = self.lumps.get(name)
+        return self.decoded_patch(name, lump) if lump is not None else None
 
-                elif cond == sbc.modeeequal:
-                    result &= self.gamemode_current == param
+    def load_fonts(self):
+        numberfonts = []
+
+        for numberfont in self.sbardef.numberfonts:
+            font = NumberFont(numberfont.name)
+            stem = numberfont.stem
+
+            names = [stem + "NUM" + str(num) for num in range(0, 10)] + [stem + "MINUS", stem + "PRCNT"]
+            key = None
+            if self.disk_cache is not None:
+                key = cache_key("atlas", *(lump_key(self.lumps[name]) for name in names if name in self.lumps))
+                cached = self.disk_cache.get(key)
+                if cached is not None:
+                    font.restore_atlas(*cached)
+                    numberfonts.append(font)
+                    continue
 
-                elif cond == sbc.modenotequal:
-                    result &= self.gamemode_current != param
+            for num in range(0, 10):
+                image = self.glyph_image(stem + "NUM" + str(num))
+                if image is not None:
+                    font.add_number(num, image)
+
+            image = self.glyph_image(stem + "MINUS")
+            if image is not None:
+                font.add_minus(image)
+
+            image = self.glyph_image(stem + "PRCNT")
+            if image is not None:
+                font.add_percent(image)
+
+            font.build_atlas()
+            if key is not None and font.atlas.width > 0:
+                self.disk_cache.put(key, font.atlas, font.atlas_metadata())
+            numberfonts.append(font)
+
+        self.numberfonts = numberfonts
+
+    @property
+    def health(self) -> int:
+        return self.player.get("health")
+
+    @health.setter
+    def health(self, value: int):
+        self.player.set("health", value)
+
+    @property
+    def armor(self) -> int:
+        return self.player.get("armor")
+
+    @armor.setter
+    def armor(self, value: int):
+        self.player.set("armor", value)
+
+    @property
+    def weapon_selected(self) -> int:
+        return self.selected_weapon
+
+    @weapon_selected.setter
+    def weapon_selected(self, value: int):
+        # Numbers showing the selected weapon's ammo switch fields with it.
+        if value == self.selected_weapon:
+            return
+        self.selected_weapon = value
+        for eid in list(self.subscribers.get(WEAPON_INPUT, ())):
+            self.subscribe_number(eid)
+
+    def load_elements(self):
+        with self.profiler.phase("load.elements"):
+            self.elements.load(self.sbardef.statusbars)
+        with self.profiler.phase("load.conditions"):
+            self.compile_conditions()
+            self.subscribe_numbers()
+
+    def compile_conditions(self):
+        self.predicates = {}
+        self.dependents = {}
+        for ref in self.elements:
+            self.predicate(ref.id)
+
+    def predicate(self, eid: int) -> tuple:
+        # Recompiled whenever the element's conditions list is replaced.
+        conditions = self.elements[eid].elem.conditions
+        entry = self.predicates.get(eid)
+        if entry is None or entry[0] is not conditions:
+            self.forget_predicate(eid)
+
+            entry = (conditions, compile_conditions(conditions))
+            self.predicates[eid] = entry
+
+            for input in dependencies(entry[1]):
+                self.dependents.setdefault(input, set()).add(eid)
+        return entry[1]
+
+    def forget_predicate(self, eid: int):
+        entry = self.predicates.pop(eid, None)
+        if entry is not None:
+            for input in dependencies(entry[1]):
+                self.dependents[input].discard(eid)
+
+    def subscribe_numbers(self):
+        self.subscribers = {}
+        self.subscriptions = {}
+        for ref in self.elements:
+            self.subscribe_number(ref.id)
+
+    def subscribe_number(self, eid: int):
+        # Called again whenever the element's type or param changes.
+        self.unsubscribe_number(eid)
+        elem = self.elements[eid].elem
+        if elem.kind != "number" and elem.kind != "percent":
+            return
+        inputs = number_inputs(elem.type, elem.param, self.selected_weapon)
+        self.subscriptions[eid] = inputs
+        for input in inputs:
+            self.subscribers.setdefault(input, set()).add(eid)
+
+    def unsubscribe_number(self, eid: int):
+        for input in self.subscriptions.pop(eid, ()):
+            self.subscribers[input].discard(eid)
+
+    def add_element(self, barindex: int, elem: Element) -> int:
+        statusbar = self.sbardef.statusbars[barindex]
+        index = len(statusbar.children or [])
+        return self.insert_element(statusbar, index, elem)
+
+    def insert_element(self, parent, index: int, elem: Element, ids: list = None) -> int:
+        eid = self.elements.insert(parent, index, elem, ids)
+        for child in self.elements.subtree(eid):
+            self.predicate(child)
+            self.subscribe_number(child)
+        return eid
+
+    def remove_element(self, eid: int) -> ElementRef:
+        for child in self.elements.subtree(eid):
+            self.forget_predicate(child)
+            self.unsubscribe_number(child)
+        return self.elements.remove(eid)
+
+    def update_element(self, eid: int, key: str, value):
+        self.elements[eid].elem.set(key, value)
+        if key == "type" or key == "param":
+            self.subscribe_number(eid)
+
+    def set_player_value(self, field: str, value: int) -> set:
+        # Returns the number elements to draw again.
+        if self.player.set(field, value):
+            return set(self.subscribers.get(field, ()))
+        return set()
+
+    def dependents_of(self, inputs) -> set:
+        # Elements whose conditions or number read one of the inputs: game
+        # state inputs from state_changes() or player fields.
+        keys = set()
+        for input in inputs:
+            keys |= self.dependents.get(input, set())
+            keys |= self.subscribers.get(input, set())
+        return keys
+
+    def game_state(self) -> tuple:
+        return pack_state(
+            weapons_owned=[value for _, value in self.weapon_items],
+            slots_owned=[value for _, value in self.slot_items],
+            weapon_selected=self.weapon_selected,
+            slot_selected=self.slot_selected,
+            session=self.session_current,
+            gamemode=self.gamemode_current,
+            hudmode=self.other_items[0][1],
+        )
 
-                elif cond == sbc.hudmodeequal:
-                    result &= self.other_items[0][1] == param
+    def number_value(self, elem: Element, weapon: int = None):
+        if weapon is None:
+            weapon = self.selected_weapon
+        return self.player.number_value(elem.type, elem.param, weapon)
 
-        return result
+    def check_conditions(self, eid: int, state: tuple = None) -> bool:
+        if state is None:
+            state = self.game_state()
+        return evaluate(self.predicate(eid), state)
 
 
 class NumberFont:
-    def __init__(self, name: str):
+    def __init__(self, name: str, cachesize: int = 256):
         self.name = name
-        self.numbers = []
+        self.glyphs = {}
+        self.boxes = {}
+        self.atlas = None
+        self.key = None
         self.maxwidth = 0
         self.maxheight = 0
-        self.minus = None
-        self.percent = None
+        self.rendered = OrderedDict()
+        self.cachesize = cachesize
+        self.hits = 0
+        self.misses = 0
 
-    def add_number(self, image):
-        self.numbers.append(cyan_to_alpha(image))
+    def add_number(self, num: int, image):
+        self.glyphs[str(num)] = image
         self.maxwidth = max(self.maxwidth, image.width)
         self.maxheight = max(self.maxheight, image.height)
 
     def add_minus(self, image):
-        self.minus = cyan_to_alpha(image)
+        self.glyphs["-"] = image
 
     def add_percent(self, image):
-        self.percent = cyan_to_alpha(image)
+        self.glyphs["%"] = image
+
+    def build_atlas(self):
+        # Pack the keyed glyphs side by side into a single strip.
+        glyphs = list(self.glyphs.items())
+        width = sum(image.width for _, image in glyphs)
+        height = max((image.height for _, image in glyphs), default=0)
+
+        self.atlas = Image.new("RGBA", (width, height))
+
+        x = 0
+        self.boxes = {}
+        for char, image in glyphs:
+            self.atlas.paste(image, (x, 0))
+            self.boxes[char] = (x, 0, x + image.width, image.height)
+            x += image.width
+
+        self.finish_atlas()
+
+    def atlas_metadata(self) -> dict:
+        return {"boxes": self.boxes, "maxwidth": self.maxwidth, "maxheight": self.maxheight}
+
+    def restore_atlas(self, atlas, metadata: dict):
+        self.atlas = atlas
+        self.boxes = {char: tuple(box) for char, box in metadata["boxes"].items()}
+        self.maxwidth = metadata["maxwidth"]
+        self.maxheight = metadata["maxheight"]
+        self.finish_atlas()
+
+    def finish_atlas(self):
+        self.key = hashlib.blake2b(
+            self.atlas.tobytes() + repr(self.boxes).encode(), digest_size=8
+        ).digest()
+        self.glyphs = {}
+        self.rendered.clear()
+
+    def glyph_width(self, char: str) -> int:
+        box = self.boxes.get(char)
+        return box[2] - box[0] if box is not None else self.maxwidth
+
+    def render_key(self, elem: Element, pct: bool, val: int = 100) -> tuple:
+        text = number_text(val, int(elem.maxlength), "-" in self.boxes)
+        # Alignment is left out: it only places the image, in align().
+        return (text, pct is True and "%" in self.boxes)
+
+    def get_pixmap(self, elem: Element, pct: bool, val: int = 100):
+        key = self.render_key(elem, pct, val)
+
+        image = self.rendered.get(key)
+        if image is not None:
+            self.rendered.move_to_end(key)
+            self.hits += 1
+            return image
+
+        self.misses += 1
+        image = self.render(*key)
+
+        self.rendered[key] = image
+        if len(self.rendered) > self.cachesize:
+            self.rendered.popitem(last=False)
 
-    def get_pixmap(self, elem: dict, pct: bool, val: int = 100):
-        val_str = str(val)
-        maxlength = int(elem["maxlength"])
-        length = min(maxlength, len(val_str))
-        totalwidth = self.maxwidth * length
+        return image
 
-        if pct is True and self.percent is not None:
-            totalwidth += self.percent.width
+    def render(self, text: str, pct: bool):
+        totalwidth = self.maxwidth * len(text)
 
-        image = Image.new("RGBA", (totalwidth, self.maxheight))
-        for i in range(0, length):
-            number = self.numbers[int(val_str[i])]
-            image.paste(number, (i * number.width, 0))
+        if pct:
+            totalwidth += self.glyph_width("%")
 
-        if pct is True and self.percent is not None:
-            image.paste(self.percent, (totalwidth - self.percent.width, 0))
+        image = Image.new("RGBA", (totalwidth, self.maxheight))
+        for i, char in enumerate(text):
+            if char in self.boxes:
+                image.alpha_composite(
+                    self.atlas,
+                    dest=(i * self.maxwidth, 0),
+                    source=self.boxes[char],
+                )
+
+        if pct:
+            image.alpha_composite(
+                self.atlas,
+                dest=(totalwidth - self.glyph_width("%"), 0),
+                source=self.boxes["%"],
+            )
 
         return image
 
 
-def cyan_to_alpha(image):
-    image = image.convert("RGBA")
+def number_text(value, maxlength: int, minus: bool) -> str:
+    # As the game draws it: a number too long for maxlength shows the
+    # largest one that fits, a minus sign takes the place of a digit, and
+    # without a minus glyph negative numbers show as 0.
+    if value is None:
+        return ""
+    if value < 0 and minus:
+        return str(max(value, 1 - 10 ** max(maxlength - 1, 0)))
+    return str(min(max(value, 0), 10 ** max(maxlength, 0) - 1))
 
-    data = image.getdata()
-    newdata = []
-    for item in data:
-        if item[0] == 255 and item[1] == 0 and item[2] == 255:
-            newdata.append((255, 0, 255, 0))
-        else:
-            newdata.append(item)
-    image.putdata(newdata)
 
-    return image
+def image_nbytes(image) -> int:
+    return image.width * image.height * len(image.getbands())
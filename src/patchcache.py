@@ -0,0 +1,74 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class PatchCache:
+    def __init__(self, budget: int = 64 * 1024 * 1024):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        # Patches may be decoded on worker threads while the GUI draws.
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def key(name: str, lump) -> tuple:
+        # The content hash keeps entries from a previously loaded WAD from
+        # being served for a lump that has the same name but new data.
+        return (name, lump.content_hash())
+
+    def get(self, key: Hashable, factory: Callable, sizeof: Callable):
+        value = self.find(key)
+        if value is None:
+            value = factory()
+            self.put(key, value, sizeof(value))
+        return value
+
+    def find(self, key: Hashable):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, nbytes: int):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            self.entries[key] = (value, nbytes)
+            self.size += nbytes
+
+            while self.size > self.budget and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def content_hash(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=8).digest()
@@ -0,0 +1,110 @@
+from conditions import WEAPON_SELECTED
+from doomdata import Ammo, Weapon, sbn
+
+# The player values number elements show, keyed by the field names
+# render.apply_state and timelines use. Each number reads one field; the
+# ones that follow the selected weapon also read the weapon selection, by
+# the same (field, index) input the compiled conditions use.
+
+AMMO_NAMES = {Ammo.clip: "clip", Ammo.shell: "shell", Ammo.cell: "cell", Ammo.misl: "misl"}
+MAX_AMMO = {Ammo.clip: 200, Ammo.shell: 50, Ammo.cell: 300, Ammo.misl: 50}
+START_AMMO = {Ammo.clip: 50, Ammo.shell: 0, Ammo.cell: 0, Ammo.misl: 0}
+
+WEAPON_INPUT = (WEAPON_SELECTED, None)
+
+
+def ammo_field(ammo: int) -> str:
+    return "ammo." + AMMO_NAMES[ammo]
+
+
+def maxammo_field(ammo: int) -> str:
+    return "maxammo." + AMMO_NAMES[ammo]
+
+
+AMMO_FIELDS = tuple(ammo_field(ammo) for ammo in AMMO_NAMES)
+MAXAMMO_FIELDS = tuple(maxammo_field(ammo) for ammo in AMMO_NAMES)
+FIELDS = ("health", "armor", "frags") + AMMO_FIELDS + MAXAMMO_FIELDS
+
+
+class PlayerState:
+    def __init__(self):
+        self.values = {"health": 100, "armor": 0, "frags": 0}
+        for ammo in AMMO_NAMES:
+            self.values[ammo_field(ammo)] = START_AMMO[ammo]
+            self.values[maxammo_field(ammo)] = MAX_AMMO[ammo]
+
+    def get(self, field: str) -> int:
+        return self.values[field]
+
+    def set(self, field: str, value: int) -> bool:
+        # Returns whether the value changed.
+        if field not in self.values:
+            raise KeyError(f"Unknown player field {field}")
+        if self.values[field] == value:
+            return False
+        self.values[field] = value
+        return True
+
+    def snapshot(self) -> dict:
+        return dict(self.values)
+
+    def changes(self, before: dict) -> list:
+        return [field for field, value in self.values.items() if before.get(field) != value]
+
+    def number_value(self, numtype: int, param: int, weapon: int):
+        # None when the number has nothing to show, like the ammo of a
+        # weapon that uses none.
+        field = number_field(numtype, param, weapon)
+        return self.values[field] if field is not None else None
+
+
+def weapon_ammo(weapon: int):
+    if 0 <= weapon < Weapon.numweapons:
+        ammo = Ammo.weapon[weapon]
+        if ammo in AMMO_NAMES:
+            return ammo
+    return None
+
+
+def number_field(numtype: int, param: int, weapon: int):
+    if numtype == sbn.health:
+        return "health"
+    if numtype == sbn.armor:
+        return "armor"
+    if numtype == sbn.frags:
+        return "frags"
+
+    if numtype == sbn.ammo or numtype == sbn.maxammo:
+        ammo = param if param in AMMO_NAMES else None
+    elif numtype == sbn.ammoselected:
+        ammo = weapon_ammo(weapon)
+    elif numtype == sbn.weaponammo or numtype == sbn.weaponmaxammo:
+        ammo = weapon_ammo(param)
+    else:
+        return None
+
+    if ammo is None:
+        return None
+    if numtype == sbn.maxammo or numtype == sbn.weaponmaxammo:
+        return maxammo_field(ammo)
+    return ammo_field(ammo)
+
+
+def ammo_masks() -> list:
+    # Weapons grouped by the ammo they use, as WEAPON_SELECTED masks: an
+    # ammoselected number shows the same field for every weapon in a mask.
+    masks = {}
+    for weapon in range(Weapon.numweapons):
+        ammo = weapon_ammo(weapon)
+        if ammo is not None:
+            masks[ammo] = masks.get(ammo, 0) | 1 << weapon
+    return list(masks.values())
+
+
+def number_inputs(numtype: int, param: int, weapon: int) -> tuple:
+    # Everything a number has to be drawn again for.
+    field = number_field(numtype, param, weapon)
+    inputs = () if field is None else (field,)
+    if numtype == sbn.ammoselected:
+        inputs += (WEAPON_INPUT,)
+    return inputs
@@ -0,0 +1,123 @@
+import time
+from collections import deque
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal
+
+from conditions import state_changes
+from render import apply_state, capture_state
+from timeline import Timeline, demo_timeline
+
+# Plays a Timeline through the model at Doom's tic rate. Each tic only the
+# elements whose conditions read a changed input, and the numbers showing a
+# changed player value, are drawn again. The tic shown always follows the wall
+# clock; when a tic takes too long the next ones are skipped, not queued.
+
+TICRATE = 35
+TIC_MS = 1000 / TICRATE
+
+
+class FrameStats:
+    def __init__(self, window: int = TICRATE * 10):
+        self.times = deque(maxlen=window)
+        self.tics = 0
+        self.late = 0
+        self.dropped = 0
+        self.redrawn = 0
+
+    def add(self, ms: float, redrawn: int, dropped: int = 0):
+        self.times.append(ms)
+        self.tics += 1
+        self.late += ms > TIC_MS
+        self.dropped += dropped
+        self.redrawn += redrawn
+
+    def summary(self) -> dict:
+        # Times are over the last `window` tics, counts since the start.
+        times = sorted(self.times)
+        return {
+            "tics": self.tics,
+            "mean_ms": sum(times) / len(times) if times else 0.0,
+            "p95_ms": times[int(len(times) * 0.95)] if times else 0.0,
+            "max_ms": times[-1] if times else 0.0,
+            "late": self.late,
+            "dropped": self.dropped,
+            "redrawn_per_tic": self.redrawn / self.tics if self.tics else 0.0,
+        }
+
+
+class TimelinePreview(QObject):
+    statsUpdated = Signal(dict)
+
+    def __init__(self, model, view, timeline: Timeline = None):
+        super().__init__()
+        self.model = model
+        self.view = view
+        self.timeline = timeline or demo_timeline()
+        self.stats = FrameStats()
+        self.saved_state = None
+        self.tic = -1
+        self.started = 0.0
+
+        # Polled at twice the tic rate so no tic is missed to timer jitter.
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(int(TIC_MS / 2))
+        self.timer.timeout.connect(self.tick)
+
+    @property
+    def running(self) -> bool:
+        return self.saved_state is not None
+
+    def set_timeline(self, timeline: Timeline):
+        running = self.running
+        if running:
+            self.stop()
+        self.timeline = timeline
+        if running:
+            self.start()
+
+    def start(self):
+        if self.running:
+            return
+        self.saved_state = capture_state(self.model)
+        self.stats = FrameStats()
+        self.tic = -1
+        self.started = time.perf_counter()
+        self.timer.start()
+
+    def stop(self):
+        # Puts back the state the preview started from; the caller redraws.
+        self.timer.stop()
+        if self.saved_state is not None:
+            apply_state(self.model, self.saved_state)
+            self.saved_state = None
+
+    def tick(self):
+        elapsed = time.perf_counter() - self.started
+        tic = int(elapsed * TICRATE) % self.timeline.length
+        if tic == self.tic:
+            return
+
+        dropped = (tic - self.tic - 1) % self.timeline.length if self.tic >= 0 else 0
+        start = time.perf_counter()
+        redrawn = self.step(tic)
+        self.stats.add((time.perf_counter() - start) * 1000, redrawn, dropped)
+
+        if self.stats.tics % TICRATE == 0:
+            self.statsUpdated.emit(self.stats.summary())
+
+    def step(self, tic: int) -> int:
+        # Shows the given tic and returns how many subtrees were redrawn.
+        self.tic = tic
+        values = self.timeline.values_at(tic)
+
+        before = self.model.game_state()
+        player = self.model.player.snapshot()
+        apply_state(self.model, values)
+
+        inputs = state_changes(before, self.model.game_state()) + self.model.player.changes(player)
+        eids = self.model.dependents_of(inputs)
+
+        if eids:
+            self.view.redraw_elements(eids)
+        return len(eids)
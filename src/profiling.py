@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Per-phase timers and counters for the load and draw paths. A profiler
+# starts disabled; phase() then hands back a shared no-op context, so the
+# instrumented code costs one call per phase. Enabled, every phase adds to
+# its totals and, while tracing, records a complete event in the Chrome
+# trace format (chrome://tracing, Perfetto).
+
+TRACE_LIMIT = 100000
+
+
+class NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self.origin = time.perf_counter_ns()
+        self.phases = {}
+        self.counters = {}
+        self.events = deque(maxlen=TRACE_LIMIT)
+        # The model is prepared on a worker thread while the GUI draws.
+        self.lock = threading.Lock()
+
+    def enable(self, trace: bool = False):
+        self.enabled = True
+        self.tracing = trace
+
+    def disable(self):
+        self.enabled = False
+        self.tracing = False
+
+    def reset(self):
+        with self.lock:
+            self.origin = time.perf_counter_ns()
+            self.phases = {}
+            self.counters = {}
+            self.events.clear()
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def record(self, name: str, start: int, end: int):
+        with self.lock:
+            entry = self.phases.get(name)
+            if entry is None:
+                entry = self.phases[name] = [0, 0, 0]
+            entry[0] += 1
+            entry[1] += end - start
+            entry[2] = end - start
+            if self.tracing:
+                self.events.append((name, start, end, threading.get_ident()))
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def last_ms(self, name: str) -> float:
+        entry = self.phases.get(name)
+        return entry[2] / 1e6 if entry is not None else 0.0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "phases": {
+                    name: {
+                        "calls": calls,
+                        "total_ms": total / 1e6,
+                        "mean_ms": total / calls / 1e6,
+                        "last_ms": last / 1e6,
+                    }
+                    for name, (calls, total, last) in self.phases.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def trace(self) -> dict:
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+            origin = self.origin
+
+        pid = os.getpid()
+        threads = {}
+        trace_events = []
+        for name, start, end, thread in events:
+            tid = threads.setdefault(thread, len(threads) + 1)
+            trace_events.append(
+                {
+                    "name": name,
+                    "cat": name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": (start - origin) / 1000,
+                    "dur": (end - start) / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                }
+            )
+        if trace_events:
+            trace_events.append(
+                {
+                    "name": "counters",
+                    "ph": "C",
+                    "ts": max(event["ts"] + event["dur"] for event in trace_events),
+                    "pid": pid,
+                    "tid": 1,
+                    "args": counters,
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def dump_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.trace(), file)
+
+
+def hit_rate(hits: int, misses: int) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
@@ -0,0 +1,91 @@
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, Signal
+
+# Keys listed in the property panel but edited elsewhere.
+READ_ONLY = ("conditions",)
+
+
+class PropertyModel(QAbstractTableModel):
+    # One model for the panel's whole lifetime. Selecting an element swaps
+    # what it shows, and an edit is reported once through valueEdited no
+    # matter how often the selection changed before.
+    valueEdited = Signal(int, str, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.eid = None
+        self.elem = None
+        self.keys = []
+
+    def set_element(self, eid: int, elem):
+        self.beginResetModel()
+        self.eid = eid
+        self.elem = elem
+        self.keys = [key for key in elem.order if key != "children"] if elem is not None else []
+        self.endResetModel()
+
+    def clear(self):
+        self.set_element(None, None)
+
+    def refresh(self):
+        # After the element changed underneath: values are updated in place
+        # so an open editor or the selection survives, unless keys changed.
+        if self.elem is None:
+            return
+        keys = [key for key in self.elem.order if key != "children"]
+        if keys != self.keys:
+            self.set_element(self.eid, self.elem)
+        elif self.keys:
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self.keys) - 1, 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return ("Key", "Value")[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        key = self.keys[index.row()]
+        if index.column() == 0:
+            return key
+        return str(self.elem.get(key))
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() == 1 and self.keys[index.row()] not in READ_ONLY:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or index.column() != 1:
+            return False
+
+        key = self.keys[index.row()]
+        old_value = self.elem.get(key)
+        try:
+            new_value = parse_value(str(value), old_value)
+        except ValueError:
+            return False
+
+        if new_value != old_value:
+            self.valueEdited.emit(self.eid, key, new_value)
+        return True
+
+
+def parse_value(text: str, old_value):
+    # The edited text takes the type of the value it replaces.
+    if isinstance(old_value, bool):
+        return text.lower() in ("true", "1", "yes")
+    if isinstance(old_value, int):
+        return int(text)
+    if isinstance(old_value, float):
+        return float(text)
+    if old_value is None:
+        return None if text.lower() == "none" else text
+    return text
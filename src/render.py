@@ -0,0 +1,184 @@
+import itertools
+
+from typing import Callable
+
+from PIL import Image
+
+from conditions import WEAPON_SELECTED, onehot_value
+from doomdata import SCREENWIDTH, Alignment
+from playerstate import FIELDS as PLAYER_FIELDS
+from sbardef import Element
+
+# Same colour the editor paints behind the status bar.
+BACKGROUND = (255, 0, 255, 255)
+
+STATE_FIELDS = PLAYER_FIELDS + ("weapon", "slot", "session", "gamemode", "hudmode")
+
+
+def align(x: float, y: float, width: int, height: int, alignment: int) -> tuple:
+    if alignment & Alignment.h_middle:
+        x -= width / 2
+    elif alignment & Alignment.h_right:
+        x -= width
+    if alignment & Alignment.v_middle:
+        y -= height / 2
+    elif alignment & Alignment.v_bottom:
+        y -= height
+    return x, y
+
+
+def apply_state(model, state: dict):
+    for field, value in state.items():
+        if field in PLAYER_FIELDS:
+            model.player.set(field, value)
+        elif field == "weapon":
+            model.weapon_selected = value
+        elif field == "slot":
+            model.slot_selected = value
+        elif field == "session":
+            model.session_current = value
+        elif field == "gamemode":
+            model.gamemode_current = value
+        elif field == "hudmode":
+            model.other_items[0][1] = value
+        elif field == "weapons":
+            # Indices into weapon_items / slot_items of what is owned.
+            for index, item in enumerate(model.weapon_items):
+                item[1] = 1 if index in value else 0
+        elif field == "slots":
+            for index, item in enumerate(model.slot_items):
+                item[1] = 1 if index in value else 0
+        else:
+            raise KeyError(f"Unknown game state field {field}")
+
+
+def capture_state(model) -> dict:
+    # What apply_state needs to put the model back as it is now.
+    return {
+        **model.player.snapshot(),
+        "weapon": model.weapon_selected,
+        "slot": model.slot_selected,
+        "session": model.session_current,
+        "gamemode": model.gamemode_current,
+        "hudmode": model.other_items[0][1],
+        "weapons": [index for index, (_, owned) in enumerate(model.weapon_items) if owned],
+        "slots": [index for index, (_, owned) in enumerate(model.slot_items) if owned],
+    }
+
+
+def state_matrix(axes: dict) -> list[dict]:
+    # Every combination of the given values, e.g.
+    # {"health": [100, 5], "weapon": [1, 2]} gives four states.
+    fields = list(axes)
+    return [dict(zip(fields, values)) for values in itertools.product(*axes.values())]
+
+
+def layout_elements(
+    model,
+    x: int,
+    y: int,
+    elem: Element,
+    state: tuple,
+    patch_image: Callable,
+    number_image: Callable,
+    visit: Callable = None,
+):
+    # The one walk both the editor view and StatusBarRenderer draw from.
+    # Yields (eid, x, y, elem, image) for elem and each element under it
+    # whose conditions pass, in drawing order, at the position its image
+    # is aligned from; image is None when there is nothing to draw. A hidden
+    # element hides its subtree. visit(eid, x, y, elem) is called for every
+    # element reached, hidden or not, with the origin it was laid out from.
+    #
+    # patch_image(name, lump) and number_image(font, elem, pct, val) make the
+    # images, so each caller gets them in its own form.
+    eid = model.elements.id_of(elem)
+    if visit is not None:
+        visit(eid, x, y, elem)
+
+    profiler = model.profiler
+    with profiler.phase("draw.conditions"):
+        shown = model.check_conditions(eid, state)
+    if shown is False:
+        return
+
+    type = elem.kind
+    x += elem.x
+    y += elem.y
+    image = None
+
+    if type == "graphic" or type == "face":
+        name = elem.patch if type == "graphic" else "STFST00"
+        lump = model.lumps.get(name)
+        if lump is not None:
+            x -= lump.x_offset
+            y -= lump.y_offset
+            with profiler.phase("draw.patch"):
+                image = patch_image(name, lump)
+
+    elif type == "number" or type == "percent":
+        for font in model.numberfonts:
+            if font.name == elem.font:
+                with profiler.phase("draw.number"):
+                    image = number_image(
+                        font,
+                        elem,
+                        type == "percent",
+                        model.number_value(elem, onehot_value(state, WEAPON_SELECTED)),
+                    )
+
+    yield eid, x, y, elem, image
+
+    if elem.children is not None:
+        for child in elem.children:
+            yield from layout_elements(model, x, y, child, state, patch_image, number_image, visit)
+
+
+class StatusBarRenderer:
+    # Draws a status bar the way View.draw lays it out, but composites into a
+    # Pillow image instead of a QGraphicsScene, so it runs without Qt.
+    def __init__(self, model, background: tuple = BACKGROUND):
+        self.model = model
+        self.background = background
+
+    def render(self, barindex: int, state: tuple = None) -> Image.Image:
+        statusbar = self.model.sbardef.statusbars[barindex]
+
+        canvas = Image.new("RGBA", (SCREENWIDTH, statusbar.height), self.background)
+
+        if state is None:
+            state = self.model.game_state()
+        for child in statusbar.children or []:
+            for _, x, y, elem, image in layout_elements(
+                self.model, 0, 0, child, state, self.model.decoded_patch, font_image
+            ):
+                if image is not None:
+                    composite(canvas, image, x, y, elem.alignment)
+
+        return canvas
+
+
+def font_image(font, elem: Element, pct: bool, val: int) -> Image.Image:
+    return font.get_pixmap(elem, pct, val)
+
+
+def composite(canvas: Image.Image, image: Image.Image, x: int, y: int, alignment: int):
+    if image.width == 0 or image.height == 0:
+        return
+
+    x, y = align(x, y, image.width, image.height, alignment)
+    x = qround(x)
+    y = qround(y)
+
+    # alpha_composite() rejects negative destinations, so clip the source.
+    left = max(0, -x)
+    top = max(0, -y)
+    if left >= image.width or top >= image.height:
+        return
+
+    canvas.alpha_composite(image, dest=(x + left, y + top), source=(left, top))
+
+
+def qround(value: float) -> int:
+    # Qt's qRound(), which places unscaled pixmaps: halves round away from 0.
+    return int(value + 0.5) if value >= 0 else int(value - 0.5)
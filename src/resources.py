@@ -0,0 +1,77 @@
+import os
+
+import sbardefjson
+
+from sbardef import SBarDef
+from wadfile import LazyLump, WadFile
+
+
+class ResourceStack:
+    # IWAD first, then PWADs in load order, optionally topped by a loose
+    # SBARDEF JSON file. Later sources override earlier ones by lump name.
+    def __init__(self):
+        self.wads = []
+        self.index = {}
+        self.graphics = {}
+        self.json_path = None
+
+    def add_wad(self, path: str) -> WadFile:
+        wad = WadFile(path)
+        self.wads.append(wad)
+        # Appending only ever adds a new top layer, so the index can be
+        # updated in place instead of rebuilt.
+        for name, (offset, size) in wad.index.items():
+            self.index[name] = (wad, offset, size)
+        self.graphics.update(wad.graphics)
+        return wad
+
+    def set_json(self, path: str):
+        self.json_path = path
+
+    def find(self, name: str) -> LazyLump:
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        wad, offset, size = entry
+        return LazyLump(wad, name, offset, size, "global")
+
+    def load_sbardef(self) -> SBarDef:
+        if self.json_path is not None:
+            return sbardefjson.load(self.json_path)
+
+        lump = self.find("SBARDEF")
+        if lump is not None:
+            return sbardefjson.loads(lump.data)
+
+        return None
+
+    def reload_wad(self, path: str) -> bool:
+        # Picks up a WAD that was rewritten on disk. Returns False when it is
+        # not part of the stack.
+        path = os.path.abspath(path)
+        reloaded = False
+        for wad in self.wads:
+            if os.path.abspath(wad.path) == path:
+                wad.reload()
+                reloaded = True
+        if not reloaded:
+            return False
+
+        self.index = {}
+        self.graphics = {}
+        for wad in self.wads:
+            for name, (offset, size) in wad.index.items():
+                self.index[name] = (wad, offset, size)
+            self.graphics.update(wad.graphics)
+        return True
+
+    def clear_wads(self):
+        # The WADs are dropped, not closed: like WadFile.reload(), this leaves
+        # each mapping to be collected once no loader thread reads from it.
+        self.wads = []
+        self.index = {}
+        self.graphics = {}
+
+    def clear(self):
+        self.clear_wads()
+        self.json_path = None
@@ -0,0 +1,356 @@
+import json
+
+# Typed, slotted records for an SBARDEF lump. Every record is validated
+# once when it is read. Keys the editor does not know are kept in `extra`,
+# and the original key order in `order`, so to_json() gives back the
+# document that was loaded.
+
+
+class SBarDefError(ValueError):
+    def __init__(self, message: str, line: int = None, column: int = None):
+        if line is not None:
+            message = f"line {line}, column {column}: {message}"
+        super().__init__(message)
+        self.line = line
+        self.column = column
+
+
+MISSING = object()
+
+# Distinct key orders are few, so records share their order tuples.
+ORDERS = {}
+
+
+def intern_order(keys) -> tuple:
+    keys = tuple(keys)
+    return ORDERS.setdefault(keys, keys)
+
+
+def where(path) -> str:
+    # Paths are built as (parent, key or index) pairs and only formatted
+    # when there is an error to report.
+    if not isinstance(path, tuple):
+        return path
+    parent, part = path
+    if isinstance(part, int):
+        return f"{where(parent)}[{part}]"
+    return f"{where(parent)}.{part}"
+
+
+class Kind:
+    # What a field may hold; isinstance alone would let true pass as 1.
+    __slots__ = ("types", "nullable", "what")
+
+    def __init__(self, types: tuple, what: str, nullable: bool = False):
+        self.types = types
+        self.nullable = nullable
+        self.what = what
+
+    def accepts(self, value) -> bool:
+        if value is None:
+            return self.nullable
+        if isinstance(value, bool):
+            return bool in self.types
+        return isinstance(value, self.types)
+
+
+integer = Kind((int,), "an integer")
+number = Kind((int, float), "a number")
+string = Kind((str,), "a string")
+optional_string = Kind((str,), "a string or null", nullable=True)
+boolean = Kind((bool,), "true or false")
+anything = None
+
+
+class Record:
+    __slots__ = ("order", "extra")
+
+    # (key, kind, required) for each key the editor understands; fields
+    # of kind anything are converted by read() and write().
+    fields = ()
+
+    def __init__(self, **values):
+        self.extra = None
+        for key, _, _ in self.fields:
+            setattr(self, key, None)
+        for key, value in values.items():
+            self.set(key, value)
+        self.order = intern_order(values)
+
+    @classmethod
+    def from_json(cls, obj, path):
+        if not isinstance(obj, dict):
+            raise SBarDefError(f"{where(path)}: expected an object")
+
+        record = cls.__new__(cls)
+        record.extra = None
+        for key, kind, required in cls.fields:
+            value = obj.get(key, MISSING)
+            if value is MISSING:
+                if required:
+                    raise SBarDefError(f"{where(path)}: missing {key!r}")
+                value = None
+            elif kind is not None:
+                if not kind.accepts(value):
+                    raise SBarDefError(f"{where((path, key))}: expected {kind.what}, got {json.dumps(value)}")
+            else:
+                value = record.read(key, value, (path, key))
+            setattr(record, key, value)
+
+        known = cls.known_keys()
+        for key, value in obj.items():
+            if key not in known:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[key] = value
+
+        record.order = intern_order(obj)
+        return record
+
+    def read(self, key: str, value, path):
+        # Converts the fields declared as anything.
+        return value
+
+    def to_json(self) -> dict:
+        known = type(self).known_keys()
+        extra = self.extra
+        return {
+            key: self.write(key, getattr(self, key)) if key in known else extra[key]
+            for key in self.order
+        }
+
+    def write(self, key: str, value):
+        return value
+
+    def get(self, key: str, default=None):
+        if key in type(self).known_keys():
+            return getattr(self, key)
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def set(self, key: str, value):
+        if key in type(self).known_keys():
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        if hasattr(self, "order") and key not in self.order:
+            self.order = intern_order(self.order + (key,))
+
+    def items(self):
+        for key in self.order:
+            yield key, self.get(key)
+
+    @classmethod
+    def known_keys(cls) -> frozenset:
+        keys = cls.__dict__.get("_known_keys")
+        if keys is None:
+            keys = frozenset(key for key, _, _ in cls.fields)
+            setattr(cls, "_known_keys", keys)
+        return keys
+
+    def __repr__(self) -> str:
+        return repr(self.to_json())
+
+
+class Condition(Record):
+    __slots__ = ("condition", "param")
+    fields = (("condition", integer, True), ("param", integer, True))
+
+
+def read_conditions(path, value):
+    if value is None:
+        return None
+    if not isinstance(value, list):
+        raise SBarDefError(f"{where(path)}: expected a list or null")
+    return [Condition.from_json(condition, (path, i)) for i, condition in enumerate(value)]
+
+
+def read_children(path, value):
+    if value is None:
+        return None
+    if not isinstance(value, list):
+        raise SBarDefError(f"{where(path)}: expected a list or null")
+    return [read_element(child, (path, i)) for i, child in enumerate(value)]
+
+
+def write_children(children):
+    return None if children is None else [child.to_json() for child in children]
+
+
+def write_conditions(conditions):
+    return None if conditions is None else [condition.to_json() for condition in conditions]
+
+
+class Element(Record):
+    __slots__ = ("x", "y", "alignment", "tranmap", "translation", "conditions", "children")
+
+    kind = None
+    fields = (
+        ("x", number, True),
+        ("y", number, True),
+        ("alignment", integer, True),
+        ("tranmap", optional_string, False),
+        ("translation", optional_string, False),
+        ("conditions", anything, True),
+        ("children", anything, True),
+    )
+
+    def read(self, key: str, value, path):
+        if key == "conditions":
+            return read_conditions(path, value)
+        if key == "children":
+            return read_children(path, value)
+        return value
+
+    def write(self, key: str, value):
+        if key == "conditions":
+            return write_conditions(value)
+        if key == "children":
+            return write_children(value)
+        return value
+
+    def to_json(self) -> dict:
+        return {self.kind: super().to_json()}
+
+
+class Canvas(Element):
+    __slots__ = ()
+    kind = "canvas"
+
+
+class Graphic(Element):
+    __slots__ = ("patch",)
+    kind = "graphic"
+    fields = Element.fields + (("patch", string, True),)
+
+
+class Animation(Element):
+    __slots__ = ("frames",)
+    kind = "animation"
+    fields = Element.fields + (("frames", anything, True),)
+
+
+class Face(Element):
+    __slots__ = ()
+    kind = "face"
+
+
+class FaceBackground(Element):
+    __slots__ = ()
+    kind = "facebackground"
+
+
+class Number(Element):
+    __slots__ = ("font", "type", "param", "maxlength")
+    kind = "number"
+    fields = Element.fields + (
+        ("font", string, True),
+        ("type", integer, True),
+        ("param", integer, True),
+        ("maxlength", integer, True),
+    )
+
+
+class Percent(Number):
+    __slots__ = ()
+    kind = "percent"
+
+
+ELEMENT_TYPES = {
+    cls.kind: cls for cls in (Canvas, Graphic, Animation, Face, FaceBackground, Number, Percent)
+}
+
+
+def read_element(obj, path) -> Element:
+    if not isinstance(obj, dict) or len(obj) != 1:
+        raise SBarDefError(f"{where(path)}: expected an object with a single element type")
+    kind, values = next(iter(obj.items()))
+    cls = ELEMENT_TYPES.get(kind)
+    if cls is None:
+        raise SBarDefError(f"{where(path)}: unknown element type {kind!r}")
+    return cls.from_json(values, (path, kind))
+
+
+class NumberFont(Record):
+    __slots__ = ("name", "type", "stem")
+    fields = (("name", string, True), ("type", integer, True), ("stem", string, True))
+
+
+class StatusBar(Record):
+    __slots__ = ("height", "fullscreenrender", "fillflat", "children")
+    fields = (
+        ("height", integer, True),
+        ("fullscreenrender", boolean, True),
+        ("fillflat", optional_string, False),
+        ("children", anything, True),
+    )
+
+    def read(self, key: str, value, path):
+        if key == "children":
+            return read_children(path, value)
+        return value
+
+    def write(self, key: str, value):
+        if key == "children":
+            return write_children(value)
+        return value
+
+
+class SBarDef(Record):
+    # The "data" object is flattened into numberfonts and statusbars; its
+    # other keys and its key order are kept in data_extra and data_order.
+    __slots__ = ("type", "version", "numberfonts", "statusbars", "data_extra", "data_order")
+    fields = (("type", string, True), ("version", string, True))
+
+    @classmethod
+    def from_json(cls, obj, path):
+        record = super().from_json(obj, path)
+        data = record.extra.pop("data", None) if record.extra else None
+        path = (path, "data")
+        if not isinstance(data, dict):
+            raise SBarDefError(f"{where(path)}: expected an object")
+        for key in ("numberfonts", "statusbars"):
+            if not isinstance(data.get(key), list):
+                raise SBarDefError(f"{where((path, key))}: expected a list")
+
+        record.numberfonts = [
+            NumberFont.from_json(font, ((path, "numberfonts"), i))
+            for i, font in enumerate(data["numberfonts"])
+        ]
+        record.statusbars = [
+            StatusBar.from_json(statusbar, ((path, "statusbars"), i))
+            for i, statusbar in enumerate(data["statusbars"])
+        ]
+        record.data_extra = {
+            key: value for key, value in data.items() if key not in ("numberfonts", "statusbars")
+        }
+        record.data_order = intern_order(data)
+        return record
+
+    def get(self, key: str, default=None):
+        if key == "data":
+            return self.data_json()
+        return super().get(key, default)
+
+    def to_json(self) -> dict:
+        return {key: self.get(key) for key in self.order}
+
+    def data_json(self) -> dict:
+        data = {}
+        for key in self.data_order:
+            if key == "numberfonts":
+                data[key] = [font.to_json() for font in self.numberfonts]
+            elif key == "statusbars":
+                data[key] = [statusbar.to_json() for statusbar in self.statusbars]
+            else:
+                data[key] = self.data_extra[key]
+        return data
+
+
+def load(obj) -> SBarDef:
+    if obj is None:
+        return None
+    return SBarDef.from_json(obj, "sbardef")
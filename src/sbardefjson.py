@@ -0,0 +1,339 @@
+import functools
+import json
+import os
+import re
+import stat
+import tempfile
+
+from json.decoder import WHITESPACE, JSONDecodeError, scanstring
+
+from sbardef import (
+    ELEMENT_TYPES,
+    Condition,
+    NumberFont,
+    SBarDef,
+    SBarDefError,
+    StatusBar,
+    intern_order,
+    where,
+)
+from wadfile import replace_lump
+
+# Reads SBARDEF text straight into records in one top-down pass. The parser
+# knows which record every object belongs to, so no intermediate dict tree
+# is built, and every error carries the line and column it was found at.
+# Scalars and free-form values (metadata, extra keys) go through the C
+# scanner from the json module.
+
+
+# Each pattern also eats the whitespace that follows, so values always
+# start at the position a match ends.
+OPEN_OBJECT = re.compile(r"[ \t\n\r]*\{[ \t\n\r]*")
+OPEN_LIST = re.compile(r"[ \t\n\r]*\[[ \t\n\r]*")
+KEY = re.compile(r'"([^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*)"[ \t\n\r]*:[ \t\n\r]*')
+OBJECT_SEPARATOR = re.compile(r"[ \t\n\r]*([,}])[ \t\n\r]*")
+LIST_SEPARATOR = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+SCALAR_MEMBER = re.compile(
+    r'"([^"\\\x00-\x1f]*)"[ \t\n\r]*:[ \t\n\r]*'
+    r'(-?(?:0|[1-9][0-9]*)|null|true|false|"[^"\\\x00-\x1f]*")'
+    r"[ \t\n\r]*([,}])[ \t\n\r]*"
+)
+CONSTANTS = {"null": None, "true": True, "false": False}
+
+
+class Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.decoder = json.JSONDecoder()
+        self.element_fields = {"conditions": self.conditions, "children": self.children}
+
+    def error(self, pos: int, path, message: str) -> SBarDefError:
+        line = self.text.count("\n", 0, pos) + 1
+        column = pos - self.text.rfind("\n", 0, pos)
+        return SBarDefError(f"{where(path)}: {message}", line, column)
+
+    def skip(self, pos: int) -> int:
+        return WHITESPACE.match(self.text, pos).end()
+
+    def value(self, pos: int, path) -> tuple:
+        try:
+            return self.decoder.raw_decode(self.text, pos)
+        except JSONDecodeError as e:
+            raise self.error(e.pos, path, e.msg) from None
+
+    def members(self, pos: int, path, member) -> int:
+        # Calls member(key, pos) for each key of the object at pos; it
+        # returns the position after the value it read.
+        text = self.text
+        match = OPEN_OBJECT.match(text, pos)
+        if match is None:
+            raise self.error(self.skip(pos), path, "expected an object")
+        pos = match.end()
+        if text.startswith("}", pos):
+            return pos + 1
+
+        while True:
+            match = KEY.match(text, pos)
+            if match is None:
+                raise self.error(self.skip(pos), path, "expected a key")
+            key = match.group(1)
+            if "\\" in key:
+                key = self.string(match.start(1), path)
+            pos = member(key, match.end())
+
+            match = OBJECT_SEPARATOR.match(text, pos)
+            if match is None:
+                raise self.error(self.skip(pos), path, "expected ',' or '}'")
+            if match.group(1) == "}":
+                return match.end(1)
+            pos = match.end()
+
+    def items(self, pos: int, path, item) -> int:
+        # Calls item(index, pos) for each entry of the array at pos.
+        text = self.text
+        match = OPEN_LIST.match(text, pos)
+        if match is None:
+            raise self.error(self.skip(pos), path, "expected a list")
+        pos = match.end()
+        if text.startswith("]", pos):
+            return pos + 1
+
+        index = 0
+        while True:
+            pos = item(index, pos)
+            index += 1
+
+            match = LIST_SEPARATOR.match(text, pos)
+            if match is None:
+                raise self.error(self.skip(pos), path, "expected ',' or ']'")
+            if match.group(1) == "]":
+                return match.end(1)
+            pos = match.end()
+
+    def string(self, pos: int, path) -> str:
+        try:
+            return scanstring(self.text, pos)[0]
+        except JSONDecodeError as e:
+            raise self.error(e.pos, path, e.msg) from None
+
+    def null(self, pos: int) -> bool:
+        return self.text.startswith("null", pos)
+
+    def record(self, cls, pos: int, path, nested=None) -> tuple:
+        # nested maps the keys whose values are records themselves to the
+        # function that reads them. Most members are a plain key and a
+        # scalar, which SCALAR_MEMBER reads in one match together with the
+        # separator after it.
+        text = self.text
+        record = cls.__new__(cls)
+        record.extra = None
+        for key, _, _ in cls.fields:
+            setattr(record, key, None)
+
+        kinds = field_kinds(cls)
+        order = {}
+
+        start = pos
+        match = OPEN_OBJECT.match(text, pos)
+        if match is None:
+            raise self.error(self.skip(pos), path, "expected an object")
+        pos = match.end()
+        end = pos + 1 if text.startswith("}", pos) else None
+
+        while end is None:
+            match = SCALAR_MEMBER.match(text, pos)
+            if match is not None and not (nested is not None and match.group(1) in nested):
+                key, raw, separator = match.groups()
+                value_pos = match.start(2)
+                value = scalar(raw)
+            else:
+                match = KEY.match(text, pos)
+                if match is None:
+                    raise self.error(self.skip(pos), path, "expected a key")
+                key = match.group(1)
+                if "\\" in key:
+                    key = self.string(match.start(1), path)
+                value_pos = match.end()
+
+                if nested is not None and key in nested:
+                    value, pos = nested[key](value_pos, (path, key))
+                else:
+                    value, pos = self.value(value_pos, (path, key))
+
+                match = OBJECT_SEPARATOR.match(text, pos)
+                if match is None:
+                    raise self.error(self.skip(pos), path, "expected ',' or '}'")
+                separator = match.group(1)
+
+            order[key] = None
+            if key in kinds:
+                kind = kinds[key]
+                if kind is not None and not kind.accepts(value):
+                    raise self.error(value_pos, (path, key), f"expected {kind.what}, got {json.dumps(value)}")
+                setattr(record, key, value)
+            elif nested is None or key not in nested:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[key] = value
+
+            if separator == "}":
+                end = match.end(match.lastindex)
+            else:
+                pos = match.end()
+
+        for key, _, required in cls.fields:
+            if required and key not in order:
+                raise self.error(start, path, f"missing {key!r}")
+
+        record.order = intern_order(order)
+        return record, end
+
+    def list_of(self, read, pos: int, path, nullable: bool = True) -> tuple:
+        if nullable and self.null(pos):
+            return None, pos + 4
+
+        result = []
+
+        def item(index: int, pos: int) -> int:
+            value, end = read(pos, (path, index))
+            result.append(value)
+            return end
+
+        return result, self.items(pos, path, item)
+
+    def conditions(self, pos: int, path) -> tuple:
+        return self.list_of(lambda pos, path: self.record(Condition, pos, path), pos, path)
+
+    def children(self, pos: int, path) -> tuple:
+        return self.list_of(self.element, pos, path)
+
+    def element(self, pos: int, path) -> tuple:
+        result = []
+
+        def member(kind: str, pos: int) -> int:
+            if result:
+                raise self.error(pos, path, "expected an object with a single element type")
+            cls = ELEMENT_TYPES.get(kind)
+            if cls is None:
+                raise self.error(pos, path, f"unknown element type {kind!r}")
+            elem, end = self.record(cls, pos, (path, kind), self.element_fields)
+            result.append(elem)
+            return end
+
+        end = self.members(pos, path, member)
+        if not result:
+            raise self.error(pos, path, "expected an object with a single element type")
+        return result[0], end
+
+    def statusbar(self, pos: int, path) -> tuple:
+        return self.record(StatusBar, pos, path, {"children": self.children})
+
+    def numberfont(self, pos: int, path) -> tuple:
+        return self.record(NumberFont, pos, path)
+
+    def sbardef(self, pos: int = 0, path="sbardef") -> SBarDef:
+        data = {}
+
+        def read_data(pos: int, data_path) -> tuple:
+            order = {}
+            extra = {}
+
+            def member(key: str, pos: int) -> int:
+                order[key] = None
+                if key == "numberfonts":
+                    data[key], end = self.list_of(self.numberfont, pos, (data_path, key), False)
+                elif key == "statusbars":
+                    data[key], end = self.list_of(self.statusbar, pos, (data_path, key), False)
+                else:
+                    extra[key], end = self.value(pos, (data_path, key))
+                return end
+
+            end = self.members(pos, data_path, member)
+            for key in ("numberfonts", "statusbars"):
+                if key not in data:
+                    raise self.error(pos, data_path, f"missing {key!r}")
+            data["extra"] = extra
+            data["order"] = intern_order(order)
+            return None, end
+
+        pos = self.skip(pos)
+        record, end = self.record(SBarDef, pos, path, {"data": read_data})
+        if "data" not in record.order:
+            raise self.error(pos, path, "missing 'data'")
+        if self.skip(end) != len(self.text):
+            raise self.error(self.skip(end), path, "extra data after the document")
+
+        record.numberfonts = data["numberfonts"]
+        record.statusbars = data["statusbars"]
+        record.data_extra = data["extra"]
+        record.data_order = data["order"]
+        return record
+
+
+def scalar(raw: str):
+    if raw[0] == '"':
+        return raw[1:-1]
+    if raw in CONSTANTS:
+        return CONSTANTS[raw]
+    return int(raw)
+
+
+@functools.cache
+def field_kinds(cls) -> dict:
+    return {key: kind for key, kind, _ in cls.fields}
+
+
+def loads(text) -> SBarDef:
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode("utf-8-sig")
+    return Parser(text.removeprefix("\ufeff")).sbardef()
+
+
+def load(path: str) -> SBarDef:
+    with open(path, "r", encoding="utf-8-sig") as file:
+        return loads(file.read())
+
+
+def read_umask() -> int:
+    # The umask can only be read by setting it, for the whole process, so
+    # this happens once at import and never on a save worker thread.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = read_umask()
+
+
+def file_mode(path: str) -> int:
+    # mkstemp creates the file private to the user; keep the mode of the
+    # file being replaced, or what a plain open() would have used.
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o666 & ~UMASK
+
+
+def save(document: dict, path: str):
+    # Streams into a temporary file beside the target and renames it over
+    # the target, so a failed save never leaves a truncated SBARDEF behind.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        os.chmod(temp, file_mode(path))
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(document, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def save_into_wad(document: dict, path: str):
+    # Only the SBARDEF lump and the directory are written; see replace_lump.
+    replace_lump(path, "SBARDEF", json.dumps(document, indent=2).encode())
@@ -0,0 +1,153 @@
+import itertools
+
+from typing import NamedTuple
+
+from conditions import NUMFIELDS, ONEHOT_FIELDS, NEVER, WEAPON_SELECTED, bit, bits, evaluate, onehot_value
+from doomdata import Weapon, Slots, Session, GameMode
+from playerstate import WEAPON_INPUT, ammo_masks, number_field
+
+# Every value a packed game-state field can take. Owned fields are indexed
+# by bit, the others by value.
+DOMAINS = (
+    range(Weapon.numweapons),
+    range(max(Slots.weapon)),
+    range(Weapon.numweapons),
+    range(1, max(Slots.weapon) + 1),
+    range(Session.deathmatch + 1),
+    range(GameMode.indetermined + 1),
+    range(2),
+)
+
+FIELD_NAMES = ("weapons", "slots", "weapon", "slot", "session", "gamemode", "hudmode")
+
+DEFAULT_LIMIT = 100000
+
+
+class SweepGroup(NamedTuple):
+    # One rendered look: a representative packed state, the elements it
+    # shows, and every state class that shows exactly those elements.
+    state: tuple
+    visible: tuple
+    classes: list
+
+
+def field_classes(field: int, masks: list, current: int) -> list:
+    # Splits a field's domain into classes that every mask tests the same
+    # way. Returns (packed value, description) per class.
+    if field not in ONEHOT_FIELDS:
+        relevant = 0
+        for mask in masks:
+            relevant |= mask
+        classes = []
+        for owned in submasks(relevant):
+            # Bits no condition reads keep their current value.
+            value = (current & ~relevant) | owned
+            description = {"owned": list(bits(owned)), "not_owned": list(bits(relevant & ~owned))}
+            classes.append((value, description))
+        return classes
+
+    groups = {}
+    for value in DOMAINS[field]:
+        signature = tuple(bool(bit(value) & mask) for mask in masks)
+        groups.setdefault(signature, []).append(value)
+
+    classes = []
+    for values in groups.values():
+        # Prefer the model's current value as the representative.
+        representative = next((value for value in values if bit(value) == current), values[0])
+        classes.append((bit(representative), values))
+    return classes
+
+
+def submasks(mask: int):
+    sub = mask
+    while True:
+        yield sub
+        if sub == 0:
+            return
+        sub = (sub - 1) & mask
+
+
+def bar_elements(model, children) -> list:
+    eids = []
+    for child in children or []:
+        eids.append(model.elements.id_of(child))
+        eids.extend(bar_elements(model, child.children))
+    return eids
+
+
+def visible_elements(model, children, state: tuple) -> tuple:
+    # Same pruning as View.draw: a hidden element hides its subtree.
+    visible = []
+    for child in children or []:
+        eid = model.elements.id_of(child)
+        if evaluate(model.predicate(eid), state):
+            visible.append(eid)
+            visible.extend(visible_elements(model, child.children, state))
+    return tuple(visible)
+
+
+def weapon_numbers(model, visible: tuple, state: tuple) -> tuple:
+    # The fields shown by the visible numbers that follow the selected weapon.
+    weapon = onehot_value(state, WEAPON_SELECTED)
+    fields = []
+    for eid in visible:
+        if WEAPON_INPUT in model.subscriptions.get(eid, ()):
+            elem = model.elements[eid].elem
+            fields.append(number_field(elem.type, elem.param, weapon))
+    return tuple(fields)
+
+
+def sweep_classes(model, barindex: int) -> list:
+    statusbar = model.sbardef.statusbars[barindex]
+
+    masks = [[] for _ in range(NUMFIELDS)]
+    for eid in bar_elements(model, statusbar.children):
+        tests = model.predicate(eid)
+        if tests is NEVER:
+            continue
+        for field, mask, _ in tests:
+            if mask not in masks[field]:
+                masks[field].append(mask)
+
+    # Numbers showing the selected weapon's ammo change with the weapon even
+    # where no condition tests it.
+    if any(WEAPON_INPUT in model.subscriptions.get(eid, ()) for eid in bar_elements(model, statusbar.children)):
+        for mask in ammo_masks():
+            if mask not in masks[WEAPON_SELECTED]:
+                masks[WEAPON_SELECTED].append(mask)
+
+    current = model.game_state()
+    return [field_classes(field, masks[field], current[field]) for field in range(NUMFIELDS)]
+
+
+def sweep(model, barindex: int, limit: int = DEFAULT_LIMIT) -> list[SweepGroup]:
+    # Only the condition bits and values some element actually tests can
+    # change what is drawn, so the sweep enumerates classes of states
+    # rather than states, and then merges classes that show the same set
+    # of elements and the same numbers.
+    classes = sweep_classes(model, barindex)
+
+    count = 1
+    for field in classes:
+        count *= len(field)
+    if count > limit:
+        raise ValueError(f"Status bar {barindex} has {count} state classes, more than {limit}")
+
+    statusbar = model.sbardef.statusbars[barindex]
+
+    groups = {}
+    for combination in itertools.product(*classes):
+        state = tuple(value for value, _ in combination)
+        visible = visible_elements(model, statusbar.children, state)
+        key = (visible, weapon_numbers(model, visible, state))
+
+        description = {FIELD_NAMES[field]: values for field, (_, values) in enumerate(combination)}
+
+        group = groups.get(key)
+        if group is None:
+            groups[key] = SweepGroup(state, visible, [description])
+        else:
+            group.classes.append(description)
+
+    return list(groups.values())
@@ -0,0 +1,112 @@
+import bisect
+import json
+
+from playerstate import AMMO_FIELDS
+from render import STATE_FIELDS
+
+# A game-state timeline: for each state field, keyframes of (tic, value).
+# Health, armor and ammo move linearly between keyframes, like a counter
+# ticking up or down; every other field holds its value until the next
+# keyframe.
+# A recorded session is just a timeline with a keyframe on every tic that
+# changed something.
+#
+#   {"tics": 140, "tracks": {"health": [[0, 100], [70, 20]], "weapon": [[0, 1], [35, 2]]}}
+#
+# Fields are those of render.apply_state.
+
+INTERPOLATED = ("health", "armor") + AMMO_FIELDS
+LIST_FIELDS = ("weapons", "slots")
+FIELDS = STATE_FIELDS + LIST_FIELDS
+
+
+class Timeline:
+    def __init__(self, tracks: dict, length: int = None):
+        self.tracks = {}
+        for field, keyframes in tracks.items():
+            if field not in FIELDS:
+                raise ValueError(f"timeline: unknown field {field!r}")
+            if not keyframes:
+                raise ValueError(f"timeline: {field} has no keyframes")
+            for _, value in keyframes:
+                if not valid_value(field, value):
+                    what = "lists of integers" if field in LIST_FIELDS else "integers"
+                    raise ValueError(f"timeline: {field} values must be {what}, got {value!r}")
+            keyframes = sorted((int(tic), value) for tic, value in keyframes)
+            if keyframes[0][0] < 0:
+                raise ValueError(f"timeline: {field} has a keyframe before tic 0")
+            self.tracks[field] = ([tic for tic, _ in keyframes], [value for _, value in keyframes])
+
+        last = max((tics[-1] for tics, _ in self.tracks.values()), default=0)
+        self.length = max(length or 0, last + 1)
+
+    def values_at(self, tic: int) -> dict:
+        values = {}
+        for field, (tics, keyvalues) in self.tracks.items():
+            i = bisect.bisect_right(tics, tic) - 1
+            if i < 0:
+                values[field] = keyvalues[0]
+            elif field in INTERPOLATED and i + 1 < len(tics):
+                t0, t1 = tics[i], tics[i + 1]
+                v0, v1 = keyvalues[i], keyvalues[i + 1]
+                values[field] = round(v0 + (v1 - v0) * (tic - t0) / (t1 - t0))
+            else:
+                values[field] = keyvalues[i]
+        return values
+
+    @classmethod
+    def from_json(cls, obj) -> "Timeline":
+        if not isinstance(obj, dict) or not isinstance(obj.get("tracks"), dict):
+            raise ValueError("timeline: expected an object with 'tracks'")
+        tracks = {}
+        for field, keyframes in obj["tracks"].items():
+            if not isinstance(keyframes, list) or not all(
+                isinstance(keyframe, list) and len(keyframe) == 2 and isinstance(keyframe[0], int)
+                for keyframe in keyframes
+            ):
+                raise ValueError(f"timeline: {field} must be a list of [tic, value] pairs")
+            tracks[field] = keyframes
+        return cls(tracks, obj.get("tics"))
+
+    def to_json(self) -> dict:
+        return {
+            "tics": self.length,
+            "tracks": {field: [list(keyframe) for keyframe in zip(*track)] for field, track in self.tracks.items()},
+        }
+
+
+def is_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def valid_value(field: str, value) -> bool:
+    if field in LIST_FIELDS:
+        return isinstance(value, list) and all(is_integer(item) for item in value)
+    return is_integer(value)
+
+
+def load(path: str) -> Timeline:
+    with open(path, "r", encoding="utf-8") as file:
+        return Timeline.from_json(json.load(file))
+
+
+def demo_timeline() -> Timeline:
+    # Ten seconds of play: health drains and is topped up, armor is picked
+    # up, the shotgun and chaingun are found and switched to and fired, a
+    # backpack doubles the ammo limits, and so on.
+    return Timeline(
+        {
+            "health": [[0, 100], [60, 64], [90, 64], [140, 12], [175, 12], [185, 112], [300, 100]],
+            "armor": [[0, 0], [100, 0], [101, 100], [200, 100], [250, 45]],
+            "frags": [[0, 0], [120, 1], [240, 2], [330, 3]],
+            "ammo.clip": [[0, 50], [70, 38], [210, 38], [211, 58], [320, 4]],
+            "ammo.shell": [[0, 0], [70, 8], [75, 8], [200, 1], [260, 1], [261, 21]],
+            "maxammo.clip": [[0, 200], [260, 400]],
+            "maxammo.shell": [[0, 50], [260, 100]],
+            "weapons": [[0, [0, 1]], [70, [0, 1, 2]], [210, [0, 1, 2, 3]]],
+            "slots": [[0, [0, 1]], [70, [0, 1, 2]], [210, [0, 1, 2, 3]]],
+            "weapon": [[0, 1], [75, 2], [215, 3], [320, 1]],
+            "slot": [[0, 1], [75, 2], [215, 3], [320, 1]],
+        },
+        length=350,
+    )
@@ -7,22 +7,28 @@ from PySide6.QtWidgets import (
     QGraphicsPixmapItem,
     QGraphicsItem,
     QGraphicsRectItem,
+    QGraphicsSimpleTextItem,
     QTreeWidgetItem,
     QListView,
     QStyledItemDelegate,
     QStyle,
+    QProgressBar,
+    QGraphicsView,
 )
 from PySide6.QtCore import (
     QObject,
     Signal,
+    Slot,
     QPointF,
     QRect,
     QAbstractListModel,
     QSize,
     Qt,
-    QSortFilterProxyModel,
+    QAbstractProxyModel,
+    QModelIndex,
+    QTimer,
 )
-from PySide6.QtGui import QPixmap, QColor
+from PySide6.QtGui import QPixmap, QColor, QImage
 
 from PIL.ImageQt import ImageQt
 
@@ -30,16 +36,41 @@ from ui_mainwindow import Ui_MainWindow
 from ui_editconditions import Ui_Dialog
 from ui_lumpsdialog import Ui_LumpsDialog
 
-from doomdata import SCREENWIDTH, Alignment, sbn
+from doomdata import SCREENWIDTH, Alignment
+from lumpindex import LumpIndex, LumpQuery
+from render import align, layout_elements
+from patchcache import PatchCache
+from sbardef import Element
+from profiling import hit_rate
 
-from typing import Callable
+import bisect
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+THUMBNAIL_WIDTH = 100
+THUMBNAIL_HEIGHT = 80
+
+# Lumps dialog namespace choices, in combo box order.
+NAMESPACES = (None, "graphics", "patches", "sprites")
+
+# A drag updates the model at most once per frame.
+DRAG_FRAME_MS = 16
 
 
 class MainWindow(QMainWindow):
     openJSONFile = Signal()
     openWadFile = Signal()
+    clearWadFiles = Signal()
     saveAsFile = Signal()
+    saveIntoWad = Signal()
     showLumps = Signal()
+    profileOverlayToggled = Signal(bool)
+    saveTrace = Signal()
+    previewToggled = Signal(bool)
+    loadTimeline = Signal()
 
     def __init__(self):
         super(MainWindow, self).__init__()
@@ -47,7 +78,13 @@ class MainWindow(QMainWindow):
         self.ui.setupUi(self)
         self.ui.actionOpenJSON.triggered.connect(self.openJSONFile)
         self.ui.actionOpenWAD.triggered.connect(self.openWadFile)
+        self.ui.actionClearWADs.triggered.connect(self.clearWadFiles)
         self.ui.actionSaveAs.triggered.connect(self.saveAsFile)
+        self.ui.actionSaveIntoWAD.triggered.connect(self.saveIntoWad)
+        self.ui.actionProfileOverlay.toggled.connect(self.profileOverlayToggled)
+        self.ui.actionSaveTrace.triggered.connect(self.saveTrace)
+        self.ui.actionPreview.toggled.connect(self.previewToggled)
+        self.ui.actionLoadTimeline.triggered.connect(self.loadTimeline)
         self.ui.addGraphic.clicked.connect(self.showLumps)
 
     def updateScale(self, value: int):
@@ -73,17 +110,34 @@ class LumpsDialog(QDialog):
         self.dlg.listView.setViewMode(QListView.IconMode)
         self.dlg.listView.setItemDelegate(LumpItemDelegate(self))
 
-        self.proxy_model = QSortFilterProxyModel()
-        self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.proxy_model = LumpFilterModel()
         self.dlg.listView.setModel(self.proxy_model)
 
-        self.dlg.filterLineEdit.textChanged.connect(self.proxy_model.setFilterRegularExpression)
+        self.dlg.filterLineEdit.textChanged.connect(self.update_filter)
+        self.dlg.namespaceCombo.currentIndexChanged.connect(self.update_filter)
+        self.dlg.maxWidthSpin.valueChanged.connect(self.update_filter)
+        self.dlg.maxHeightSpin.valueChanged.connect(self.update_filter)
 
         self.dlg.pushOK.clicked.connect(self.accept)
         self.dlg.pushCancel.clicked.connect(self.reject)
 
     def setModel(self, model):
+        previous = self.proxy_model.sourceModel()
+        if isinstance(previous, LumpModel):
+            previous.close()
         self.proxy_model.setSourceModel(model)
+        self.update_filter()
+
+    def update_filter(self):
+        namespace = NAMESPACES[self.dlg.namespaceCombo.currentIndex()]
+        self.proxy_model.setQuery(
+            LumpQuery(
+                text=self.dlg.filterLineEdit.text(),
+                namespaces=frozenset((namespace,)) if namespace else frozenset(),
+                max_width=self.dlg.maxWidthSpin.value(),
+                max_height=self.dlg.maxHeightSpin.value(),
+            )
+        )
 
     def accept(self):
         selected_indexes = self.dlg.listView.selectedIndexes()
@@ -94,6 +148,75 @@ class LumpsDialog(QDialog):
         super().accept()
 
 
+class LumpFilterModel(QAbstractProxyModel):
+    # Shows the rows of a LumpModel that match a LumpQuery, answered from a
+    # name index instead of testing every row on each keystroke.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lump_index = None
+        self.query = LumpQuery()
+        self.rows = []
+
+    def setSourceModel(self, model):
+        previous = self.sourceModel()
+        if previous is not None:
+            previous.dataChanged.disconnect(self.source_data_changed)
+
+        self.beginResetModel()
+        super().setSourceModel(model)
+        self.lump_index = LumpIndex(model.lumps)
+        self.rows = self.lump_index.search(self.query)
+        self.endResetModel()
+
+        model.dataChanged.connect(self.source_data_changed)
+
+    def setQuery(self, query: LumpQuery):
+        if query == self.query or self.lump_index is None:
+            self.query = query
+            return
+        self.query = query
+        rows = self.lump_index.search(query)
+        if rows != self.rows:
+            self.beginResetModel()
+            self.rows = rows
+            self.endResetModel()
+
+    def source_data_changed(self, top_left, bottom_right, roles):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            index = self.mapFromSource(self.sourceModel().index(row))
+            if index.isValid():
+                self.dataChanged.emit(index, index, roles)
+
+    def mapToSource(self, index):
+        if not index.isValid() or self.sourceModel() is None:
+            return QModelIndex()
+        return self.sourceModel().index(self.rows[index.row()])
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        position = bisect.bisect_left(self.rows, index.row())
+        if position == len(self.rows) or self.rows[position] != index.row():
+            return QModelIndex()
+        return self.createIndex(position, 0)
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < len(self.rows):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+
 class LumpItemDelegate(QStyledItemDelegate):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -102,17 +225,8 @@ class LumpItemDelegate(QStyledItemDelegate):
         source_model = index.model().sourceModel()
         lump_name = index.data(Qt.DisplayRole)
 
-        # Get pixmap from cache or load it
-        if lump_name in source_model.pixmap_cache:
-            pixmap = source_model.pixmap_cache[lump_name]
-        else:
-            try:
-                lump = source_model.lumps[lump_name]
-                pixmap = lump_to_pixmap(lump)
-                source_model.pixmap_cache[lump_name] = pixmap
-            except Exception as e:
-                print(f"Could not convert lump {lump_name} to pixmap: {e}")
-                pixmap = None
+        # None until the loader thread has produced it.
+        thumbnail = source_model.thumbnail(lump_name)
 
         painter.save()
 
@@ -121,19 +235,19 @@ class LumpItemDelegate(QStyledItemDelegate):
             painter.fillRect(option.rect, option.palette.highlight())
 
         # Define cell geometry
-        cell_width = 100
-        image_height = 80
+        cell_width = THUMBNAIL_WIDTH
+        image_height = THUMBNAIL_HEIGHT
         text_height = 20
 
-        # Scale and draw icon
-        if pixmap:
-            scaled_pixmap = pixmap.scaled(cell_width, image_height, Qt.KeepAspectRatio, Qt.FastTransformation)
-            
-            # Center the pixmap
-            x = option.rect.left() + (cell_width - scaled_pixmap.width()) / 2
-            y = option.rect.top() + (image_height - scaled_pixmap.height()) / 2
-            
-            painter.drawPixmap(x, y, scaled_pixmap)
+        if thumbnail is None:
+            placeholder = QRect(option.rect.left(), option.rect.top(), cell_width, image_height)
+            painter.fillRect(placeholder.adjusted(20, 16, -20, -16), option.palette.midlight())
+        elif not thumbnail.isNull():
+            # Center the thumbnail
+            x = option.rect.left() + (cell_width - thumbnail.width()) / 2
+            y = option.rect.top() + (image_height - thumbnail.height()) / 2
+
+            painter.drawImage(QPointF(x, y), thumbnail)
 
         # Draw text
         text_rect = QRect(option.rect.left(), option.rect.top() + image_height, cell_width, text_height)
@@ -145,12 +259,95 @@ class LumpItemDelegate(QStyledItemDelegate):
         return QSize(100, 100)
 
 
+class ThumbnailLoader(QObject):
+    # Makes thumbnails on a background thread. Rows ask for theirs as they
+    # are painted and the newest request is served first, so the rows on
+    # screen now win over rows that were scrolled past; the oldest
+    # requests are dropped once too many are waiting.
+    thumbnailReady = Signal(str, QImage, str)  # name, image, error message or ""
+
+    def __init__(self, load: Callable, maxpending: int = 256):
+        super().__init__()
+        self.load = load
+        self.maxpending = maxpending
+        self.pending = OrderedDict()
+        self.current = None
+        self.stopped = False
+        self.condition = threading.Condition()
+        # Not self.thread, which would hide QObject.thread().
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def request(self, name: str, lump):
+        with self.condition:
+            if name == self.current:
+                return
+            self.pending[name] = lump
+            self.pending.move_to_end(name)
+            while len(self.pending) > self.maxpending:
+                self.pending.popitem(last=False)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.pending.clear()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                name, lump = self.pending.popitem()
+                self.current = name
+
+            error = ""
+            try:
+                # scaled() copies the pixels out of the ImageQt buffer.
+                image = ImageQt(self.load(lump)).scaled(
+                    THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, Qt.KeepAspectRatio, Qt.FastTransformation
+                )
+            except Exception as e:
+                image = QImage()
+                error = str(e)
+
+            with self.condition:
+                self.current = None
+            self.thumbnailReady.emit(name, image, error)
+
+
 class LumpModel(QAbstractListModel):
-    def __init__(self, lumps, parent=None):
+    def __init__(self, lumps, load: Callable, budget: int = 32 * 1024 * 1024, parent=None):
         super().__init__(parent)
         self.lumps = lumps
         self.lump_names = list(lumps.keys())
-        self.pixmap_cache = {}
+        self.rows = {name: row for row, name in enumerate(self.lump_names)}
+        self.thumbnails = PatchCache(budget)
+        self.errors = {}
+        self.loader = ThumbnailLoader(load)
+        self.loader.thumbnailReady.connect(self.thumbnail_ready)
+
+    def thumbnail(self, name: str) -> QImage:
+        image = self.thumbnails.find(name)
+        if image is None and name in self.lumps:
+            self.loader.request(name, self.lumps[name])
+        return image
+
+    @Slot(str, QImage, str)
+    def thumbnail_ready(self, name: str, image: QImage, error: str):
+        self.thumbnails.put(name, image, max(image.sizeInBytes(), 1))
+        if error:
+            self.errors[name] = error
+        row = self.rows.get(name)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole, Qt.ToolTipRole])
+
+    def close(self):
+        self.loader.stop()
 
     def rowCount(self, parent):
         return len(self.lump_names)
@@ -165,66 +362,102 @@ class LumpModel(QAbstractListModel):
         if role == Qt.DisplayRole:
             return lump_name
 
+        if role == Qt.ToolTipRole and lump_name in self.errors:
+            return f"Could not make a thumbnail: {self.errors[lump_name]}"
+
         return None
 
 
 class SBarElem(QObject, QGraphicsPixmapItem):
-    updateElem = Signal(dict)
+    # Dragging is reported as a scene-space offset from the press; the view
+    # moves the elements in the model and the items follow on redraw.
+    updateElem = Signal(int)
+    dragStarted = Signal(int)
+    dragMoved = Signal(float, float)
+    dragFinished = Signal()
 
     def __init__(
         self,
+        eid: int,
         x: int,
         y: int,
-        elem: dict,
+        elem: Element,
         screenheight: int,
         pixmap: QPixmap,
     ):
         QObject.__init__(self)
         QGraphicsPixmapItem.__init__(self, pixmap)
 
-        self.elem = elem
-        self.x_diff = x - int(elem["x"])
-        self.y_diff = y - int(elem["y"])
-        self.screenheight = screenheight
+        self.eid = eid
+        self.pixmap_key = pixmap.cacheKey()
+        self.press_pos = None
         self.setFlags(
             self.flags()
             | QGraphicsItem.GraphicsItemFlag.ItemIsSelectable
             | QGraphicsItem.GraphicsItemFlag.ItemIsMovable
             | QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges
         )
+        self.sync(x, y, elem, screenheight, pixmap)
 
-    def mouseReleaseEvent(self, event) -> None:
-        x = int(self.x())
-        y = int(self.y())
-        width = int(self.boundingRect().width())
-        height = int(self.boundingRect().height())
-        alignment = self.elem["alignment"]
+    def sync(
+        self,
+        x: int,
+        y: int,
+        elem: Element,
+        screenheight: int,
+        pixmap: QPixmap,
+    ) -> bool:
+        self.elem = elem
+        self.screenheight = screenheight
+
+        changed = False
 
-        if not alignment & Alignment.h_middle:
-            x = clamp(0, SCREENWIDTH - width + 1, x)
-        if not alignment & Alignment.v_middle:
-            y = clamp(0, self.screenheight - height + 1, y)
+        if pixmap.cacheKey() != self.pixmap_key:
+            self.setPixmap(pixmap)
+            self.pixmap_key = pixmap.cacheKey()
+            changed = True
 
-        self.setPos(QPointF(x, y))
+        pos = QPointF(*align(x, y, pixmap.width(), pixmap.height(), elem.alignment))
+        if pos != self.pos():
+            self.setPos(pos)
+            changed = True
 
-        if alignment & Alignment.h_middle:
-            x += width / 2
-        elif alignment & Alignment.h_right:
-            x += width
-        if alignment & Alignment.v_middle:
-            y += height / 2
-        elif alignment & Alignment.v_bottom:
-            y += height
+        return changed
 
-        self.elem["x"] = x - self.x_diff
-        self.elem["y"] = y - self.y_diff
+    def mousePressEvent(self, event) -> None:
+        super().mousePressEvent(event)
+        if event.button() == Qt.LeftButton:
+            self.press_pos = event.scenePos()
+            self.dragStarted.emit(self.eid)
 
-        self.updateElem.emit(self.elem)
+    def mouseMoveEvent(self, event) -> None:
+        # The base class would move only the selected items themselves.
+        if self.press_pos is None:
+            return super().mouseMoveEvent(event)
+        offset = event.scenePos() - self.press_pos
+        self.dragMoved.emit(offset.x(), offset.y())
+
+    def mouseReleaseEvent(self, event) -> None:
+        if self.press_pos is not None:
+            self.press_pos = None
+            self.dragFinished.emit()
+        self.updateElem.emit(self.eid)
 
         return super().mouseReleaseEvent(event)
 
-    def to_dict(self):
-        return self.elem
+
+class Drag:
+    # One drag gesture: where each dragged root started in the model, how
+    # far the group may go before an item leaves the screen, and the offset
+    # waiting for the next frame.
+    __slots__ = ("number", "starts", "limits", "offset", "pending")
+
+    def __init__(self, number: int, starts: dict, limits: tuple):
+        self.number = number
+        self.starts = starts
+        self.limits = limits
+        self.offset = (0, 0)
+        self.pending = None
 
 
 class SBarCondItem(QTreeWidgetItem):
@@ -237,34 +470,40 @@ def clamp(smallest, largest, n):
     return max(smallest, min(n, largest))
 
 
-def lump_to_pixmap(lump) -> QPixmap:
-    image = lump.to_Image()
-    image = cyan_to_alpha(image)
-    return QPixmap(ImageQt(image))
+def pixmap_nbytes(pixmap: QPixmap) -> int:
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
 
 
-def image_to_pixmap(image) -> QPixmap:
-    image = cyan_to_alpha(image)
-    return QPixmap(ImageQt(image))
+def number_pixmap(cache: PatchCache, font, elem: Element, pct: bool, val: int) -> QPixmap:
+    return cache.get(
+        ("numberfont", font.key) + font.render_key(elem, pct, val),
+        lambda: image_to_pixmap(font.get_pixmap(elem, pct, val)),
+        pixmap_nbytes,
+    )
 
 
-def cyan_to_alpha(image):
-    image = image.convert("RGBA")
+def image_to_pixmap(image) -> QPixmap:
+    if image.width == 0 or image.height == 0:
+        return QPixmap()
+    return QPixmap(ImageQt(image))
 
-    data = image.getdata()
-    newdata = []
-    for item in data:
-        if item[0] == 255 and item[1] == 0 and item[2] == 255:
-            newdata.append((255, 0, 255, 0))
-        else:
-            newdata.append(item)
-    image.putdata(newdata)
 
-    return image
+class DrawStats(NamedTuple):
+    diff_ms: float
+    apply_ms: float
+    added: int
+    removed: int
+    updated: int
+    drawn: int
+    culled: int
 
 
 class View(QObject):
-    elementRemoved = Signal(dict)
+    elementRemoved = Signal(int)
+    elementsMoved = Signal(object, int)  # {eid: (x, y)}, drag number
+    drawFinished = Signal(DrawStats)
+    modelPrepared = Signal(str)
+    saveFinished = Signal(str, str)
 
     def __init__(self, model):
         QObject.__init__(self)
@@ -274,7 +513,29 @@ class View(QObject):
         self.edit_cond_dialog = EditCond(self.main_window)
         self.lumps_dialog = LumpsDialog(self.main_window)
 
+        self.background = None
+        self.statusbar = None
+        self.scene_items = {}
+        self.layout = {}
+        self.draw_stats = None
+        self.culled = 0
+        self.overlay = None
+        self.show_overlay = False
+
+        self.drag = None
+        self.drag_number = 0
+        self.drag_timer = QTimer(self)
+        self.drag_timer.setSingleShot(True)
+        self.drag_timer.setInterval(DRAG_FRAME_MS)
+        self.drag_timer.timeout.connect(self.apply_drag)
+
         self.main_window.ui.graphicsView.setScene(self.scene)
+        self.main_window.ui.graphicsView.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
+
+        self.progress = QProgressBar()
+        self.progress.setMaximumWidth(200)
+        self.progress.hide()
+        self.main_window.statusBar().addPermanentWidget(self.progress)
 
         self.main_window.ui.removeElem.setEnabled(False)
         self.scene.selectionChanged.connect(self.on_selection_changed)
@@ -288,97 +549,305 @@ class View(QObject):
     def remove_selected_element(self):
         selected_items = self.scene.selectedItems()
         if selected_items:
-            self.elementRemoved.emit(selected_items[0].to_dict())
+            self.elementRemoved.emit(selected_items[0].eid)
+
+    @Slot(int)
+    def begin_drag(self, eid: int):
+        # Every selected element moves, but one whose ancestor is also
+        # selected already moves with it.
+        selected = {item.eid for item in self.scene.selectedItems()} | {eid}
+        roots = [eid for eid in sorted(selected) if not self.has_ancestor_in(eid, selected)]
+
+        starts = {}
+        left = top = -math.inf
+        right = bottom = math.inf
+        for root in roots:
+            elem = self.model.elements[root].elem
+            starts[root] = (elem.x, elem.y)
+
+            item = self.scene_items.get(root)
+            if item is None:
+                continue
+            # An item that is already off the screen may stay where it is.
+            rect = item.boundingRect()
+            if not elem.alignment & Alignment.h_middle:
+                left = max(left, min(0, -item.x()))
+                right = min(right, max(0, SCREENWIDTH - rect.width() + 1 - item.x()))
+            if not elem.alignment & Alignment.v_middle:
+                top = max(top, min(0, -item.y()))
+                bottom = min(bottom, max(0, self.screenheight - rect.height() + 1 - item.y()))
+
+        self.drag_number += 1
+        self.drag = Drag(self.drag_number, starts, (left, top, right, bottom))
+
+    def has_ancestor_in(self, eid: int, eids: set) -> bool:
+        parent = self.model.elements[eid].parent
+        while isinstance(parent, Element):
+            parent_id = self.model.elements.id_of(parent)
+            if parent_id in eids:
+                return True
+            parent = self.model.elements[parent_id].parent
+        return False
+
+    @Slot(float, float)
+    def drag_to(self, dx: float, dy: float):
+        # Mouse moves arrive faster than frames; only the latest offset is
+        # kept and applied by the frame timer.
+        if self.drag is None:
+            return
+        left, top, right, bottom = self.drag.limits
+        self.drag.pending = (round(clamp(left, right, dx)), round(clamp(top, bottom, dy)))
+        if not self.drag_timer.isActive():
+            self.drag_timer.start()
+
+    def apply_drag(self):
+        drag = self.drag
+        if drag is None or drag.pending is None:
+            return
+        offset, drag.pending = drag.pending, None
+        if offset == drag.offset:
+            return
+        drag.offset = offset
+
+        dx, dy = offset
+        self.elementsMoved.emit({eid: (x + dx, y + dy) for eid, (x, y) in drag.starts.items()}, drag.number)
+
+    @Slot()
+    def end_drag(self):
+        self.drag_timer.stop()
+        self.apply_drag()
+        self.drag = None
+
+    @Slot(int, int)
+    def show_progress(self, done: int, total: int):
+        if done >= total:
+            self.progress.hide()
+            return
+        self.progress.setRange(0, total)
+        self.progress.setValue(done)
+        self.progress.show()
 
     def clear_scene(self):
         for item in self.scene.items():
             self.scene.removeItem(item)
+        self.background = None
+        self.overlay = None
+        self.statusbar = None
+        self.scene_items = {}
+        self.layout = {}
 
     def draw(self, barindex: int, update: Callable):
-        self.clear_scene()
         self.update_properties = update
-        
+
         if self.model.sbardef is None:
+            self.clear_scene()
             return
 
-        statusbar = self.model.sbardef["data"]["statusbars"][barindex]
+        profiler = self.model.profiler
+        start = time.perf_counter()
+        cache_counts = self.cache_counts()
 
-        self.screenheight = statusbar["height"]
+        with profiler.phase("draw"):
+            statusbar = self.model.sbardef.statusbars[barindex]
+            self.statusbar = statusbar
 
-        rect = QRect(0, 0, SCREENWIDTH, self.screenheight)
-        self.scene.setSceneRect(rect)
-        item = QGraphicsRectItem(rect)
-        item.setBrush(QColor(255, 0, 255, 255))
-        self.scene.addItem(item)
+            self.screenheight = statusbar.height
+
+            with profiler.phase("draw.layout"):
+                state = self.model.game_state()
+                visible = {}
+                self.layout = {}
+                self.culled = 0
+                if statusbar.children is not None:
+                    for child in statusbar.children:
+                        self.draw_elem(0, 0, child, state, visible)
+
+            diffed = time.perf_counter()
 
-        if statusbar["children"] is not None:
-            for child in statusbar["children"]:
-                self.draw_elem(0, 0, child)
+            with profiler.phase("draw.scene"):
+                added, removed, updated = self.apply(visible, set(self.scene_items))
 
-    def draw_elem(self, x: int, y: int, elem: dict):
-        type = next(iter(elem))
-        values = next(iter(elem.values()))
+        self.report(start, diffed, added, removed, updated, len(visible), cache_counts)
 
-        if self.model.check_conditions(values) is False:
+    def redraw_dependents(self, inputs: list):
+        # Re-check only the subtrees whose conditions read one of the changed
+        # game-state inputs.
+        self.redraw_elements(self.model.dependents_of(inputs))
+
+    def redraw_elements(self, eids, removed=()):
+        # Lays out the given subtrees again from their recorded origins and
+        # drops the removed elements. Elements under a hidden parent have no
+        # layout entry and stay hidden.
+        if self.model.sbardef is None or self.statusbar is None:
+            return
+
+        profiler = self.model.profiler
+        start = time.perf_counter()
+        cache_counts = self.cache_counts()
+
+        with profiler.phase("redraw"):
+            with profiler.phase("draw.layout"):
+                state = self.model.game_state()
+
+                visible = {}
+                stale = set(removed)
+                for eid in removed:
+                    self.layout.pop(eid, None)
+
+                self.culled = 0
+                for eid in sorted(eids):
+                    if eid in stale or eid not in self.model.elements:
+                        continue
+                    ref = self.model.elements[eid]
+                    if eid in self.layout:
+                        x, y, elem = self.layout[eid]
+                    elif ref.parent is self.statusbar:
+                        x, y, elem = 0, 0, ref.elem
+                    else:
+                        continue
+                    subtree = self.model.elements.subtree(eid)
+                    stale.update(subtree)
+                    for child in subtree:
+                        self.layout.pop(child, None)
+                    self.draw_elem(x, y, elem, state, visible)
+
+            diffed = time.perf_counter()
+
+            with profiler.phase("draw.scene"):
+                added, removed, updated = self.apply(visible, stale)
+
+        self.report(start, diffed, added, removed, updated, len(visible), cache_counts)
+
+    def cache_counts(self) -> tuple:
+        cache = self.model.patch_cache
+        glyph_hits = sum(font.hits for font in self.model.numberfonts)
+        glyph_misses = sum(font.misses for font in self.model.numberfonts)
+        return cache.hits, cache.misses, glyph_hits, glyph_misses
+
+    def report(
+        self, start: float, diffed: float, added: int, removed: int, updated: int, drawn: int, cache_counts: tuple
+    ):
+        self.draw_stats = DrawStats(
+            diff_ms=(diffed - start) * 1000,
+            apply_ms=(time.perf_counter() - diffed) * 1000,
+            added=added,
+            removed=removed,
+            updated=updated,
+            drawn=drawn,
+            culled=self.culled,
+        )
+
+        profiler = self.model.profiler
+        if profiler.enabled:
+            after = self.cache_counts()
+            for name, before, now in zip(
+                ("pixmap.hits", "pixmap.misses", "glyph.hits", "glyph.misses"), cache_counts, after
+            ):
+                profiler.count(name, now - before)
+            profiler.count("draw.drawn", drawn)
+            profiler.count("draw.culled", self.culled)
+            profiler.count("draw.added", added)
+            profiler.count("draw.removed", removed)
+            profiler.count("draw.updated", updated)
+
+        self.update_overlay()
+        self.drawFinished.emit(self.draw_stats)
+
+    def set_overlay(self, shown: bool):
+        self.show_overlay = shown
+        self.update_overlay()
+
+    def update_overlay(self):
+        # Drawn on top of the status bar at a fixed size whatever the zoom.
+        if not self.show_overlay or self.draw_stats is None or self.statusbar is None:
+            if self.overlay is not None:
+                self.scene.removeItem(self.overlay)
+                self.overlay = None
             return
 
-        x += values["x"]
-        y += values["y"]
-
-        if type == "graphic":
-            patch = values["patch"]
-            if patch in self.model.lumps:
-                lump = self.model.lumps[patch]
-                x -= lump.x_offset
-                y -= lump.y_offset
-                pixmap = lump_to_pixmap(lump)
-                self.add_to_scene(x, y, values, pixmap)
-
-        elif type == "number" or type == "percent":
-            for font in self.model.numberfonts:
-                if font.name == values["font"]:
-                    numtype = values["type"]
-                    num = 100
-                    if numtype == sbn.health:
-                        num = self.model.health
-                    elif numtype == sbn.armor:
-                        num = self.model.armor
-                    pixmap = image_to_pixmap(
-                        font.get_pixmap(
-                            elem=values,
-                            pct=True if type == "percent" else False,
-                            val=num,
-                        )
-                    )
-                    self.add_to_scene(x, y, values, pixmap)
-
-        elif type == "face":
-            lump = self.model.lumps["STFST00"]
-            if lump is not None:
-                x -= lump.x_offset
-                y -= lump.y_offset
-                pixmap = lump_to_pixmap(lump)
-                self.add_to_scene(x, y, values, pixmap)
-
-        if values["children"] is not None:
-            for child in values["children"]:
-                self.draw_elem(x, y, child)
-
-    def add_to_scene(self, x: int, y: int, elem: dict, pixmap: QPixmap):
-        alignment = elem["alignment"]
-
-        item = SBarElem(x, y, elem=elem, screenheight=self.screenheight, pixmap=pixmap)
-
-        item.updateElem.connect(self.update_properties)
-
-        if alignment & Alignment.h_middle:
-            x -= pixmap.width() / 2
-        elif alignment & Alignment.h_right:
-            x -= pixmap.width()
-        if alignment & Alignment.v_middle:
-            y -= pixmap.height() / 2
-        elif alignment & Alignment.v_bottom:
-            y -= pixmap.height()
-
-        item.setPos(QPointF(x, y))
-        self.scene.addItem(item)
+        if self.overlay is None:
+            self.overlay = QGraphicsRectItem()
+            self.overlay.setBrush(QColor(0, 0, 0, 180))
+            self.overlay.setPen(Qt.NoPen)
+            self.overlay.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIgnoresTransformations)
+            self.overlay.setZValue(1e9)
+            text = QGraphicsSimpleTextItem(self.overlay)
+            text.setBrush(QColor(255, 255, 255))
+            text.setPos(4, 2)
+            self.scene.addItem(self.overlay)
+
+        stats = self.draw_stats
+        counters = self.model.profiler.counters
+        text = self.overlay.childItems()[0]
+        text.setText(
+            f"frame {stats.diff_ms + stats.apply_ms:.2f} ms "
+            f"(layout {stats.diff_ms:.2f}, scene {stats.apply_ms:.2f})\n"
+            f"drawn {stats.drawn}, culled {stats.culled} "
+            f"(+{stats.added} -{stats.removed} ~{stats.updated})\n"
+            f"pixmap cache {hit_rate(counters.get('pixmap.hits', 0), counters.get('pixmap.misses', 0)):.0%}, "
+            f"glyph cache {hit_rate(counters.get('glyph.hits', 0), counters.get('glyph.misses', 0)):.0%}"
+        )
+        self.overlay.setRect(text.boundingRect().adjusted(0, 0, 8, 4))
+
+    def draw_elem(self, x: int, y: int, elem: Element, state: tuple, visible: dict):
+        for eid, x, y, elem, pixmap in layout_elements(
+            self.model, x, y, elem, state, self.patch_pixmap, self.number_pixmap, self.record_layout
+        ):
+            # Every element reached counts as culled until it is shown.
+            self.culled -= 1
+            if pixmap is not None:
+                visible[eid] = (x, y, elem, pixmap)
+
+    def record_layout(self, eid: int, x: int, y: int, elem: Element):
+        self.layout[eid] = (x, y, elem)
+        self.culled += 1
+
+    def number_pixmap(self, font, elem: Element, pct: bool, val: int) -> QPixmap:
+        return number_pixmap(self.model.patch_cache, font, elem, pct, val)
+
+    def patch_pixmap(self, name: str, lump) -> QPixmap:
+        # Reuses the keyed image decoded by SBarModel.prepare() when present;
+        # None for a patch that cannot be decoded.
+        key = PatchCache.key(name, lump)
+        pixmap = self.model.patch_cache.find(key)
+        if pixmap is None:
+            image = self.model.decoded_patch(name, lump)
+            if image is None:
+                return None
+            pixmap = image_to_pixmap(image)
+            self.model.patch_cache.put(key, pixmap, pixmap_nbytes(pixmap))
+        return pixmap
+
+    def apply(self, visible: dict, stale: set) -> tuple[int, int, int]:
+        rect = QRect(0, 0, SCREENWIDTH, self.screenheight)
+        if self.background is None:
+            self.background = QGraphicsRectItem()
+            self.background.setBrush(QColor(255, 0, 255, 255))
+            self.scene.addItem(self.background)
+        if self.background.rect() != rect:
+            self.background.setRect(rect)
+            self.scene.setSceneRect(rect)
+
+        removed = (stale & self.scene_items.keys()) - visible.keys()
+        for eid in removed:
+            self.scene.removeItem(self.scene_items.pop(eid))
+
+        added = updated = 0
+        for eid, (x, y, elem, pixmap) in visible.items():
+            item = self.scene_items.get(eid)
+            if item is None:
+                item = SBarElem(eid, x, y, elem=elem, screenheight=self.screenheight, pixmap=pixmap)
+                item.updateElem.connect(self.update_properties)
+                item.dragStarted.connect(self.begin_drag)
+                item.dragMoved.connect(self.drag_to)
+                item.dragFinished.connect(self.end_drag)
+                self.scene_items[eid] = item
+                self.scene.addItem(item)
+                added += 1
+            elif item.sync(x, y, elem, self.screenheight, pixmap):
+                updated += 1
+            # IDs are handed out in draw order, so they double as Z values.
+            if item.zValue() != eid:
+                item.setZValue(eid)
+
+        return added, len(removed), updated
@@ -0,0 +1,231 @@
+import mmap
+import os
+import struct
+
+from omg.util import inwclist, wccmp
+
+from decode import decode_patch
+from patchcache import content_hash
+
+# Names omgifol files under WAD.graphics when they sit outside any marker
+# range; the editor has always offered these next to patches and sprites.
+GRAPHIC_NAMES = [
+    "TITLEPIC", "CWILV*", "WI*", "M_*",
+    "INTERPIC", "BRDR*", "PFUB?", "ST*",
+    "VICTORY2", "CREDIT", "END?", "WI*",
+    "BOSSBACK", "ENDPIC", "HELP", "BOX??",
+    "AMMNUM?", "HELP1", "DIG*",
+]
+
+# Marker ranges whose lumps are Doom pictures, by namespace.
+PICTURE_MARKERS = {"S": "sprites", "P": "patches"}
+
+HEADER = struct.Struct("<4sii")  # magic, numlumps, infotableofs
+ENTRY = struct.Struct("<ii8s")  # offset, size, name
+
+
+class LazyLump:
+    __slots__ = ("wad", "name", "offset", "size", "namespace", "digest")
+
+    def __init__(self, wad, name: str, offset: int, size: int, namespace: str):
+        self.wad = wad
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.namespace = namespace
+        self.digest = None
+
+    @property
+    def data(self) -> bytes:
+        return self.wad.read(self.offset, self.size)
+
+    def content_hash(self) -> bytes:
+        if self.digest is None:
+            self.digest = content_hash(self.data)
+        return self.digest
+
+    @property
+    def dimensions(self) -> tuple:
+        return self.wad.unpack("<hh", self.offset)
+
+    @property
+    def offsets(self) -> tuple:
+        return self.wad.unpack("<hh", self.offset + 4)
+
+    width = property(lambda self: self.dimensions[0])
+    height = property(lambda self: self.dimensions[1])
+    x_offset = property(lambda self: self.offsets[0])
+    y_offset = property(lambda self: self.offsets[1])
+
+    def to_Image(self, mode: str = "P"):
+        image = decode_patch(self.data)
+        return image if mode == "P" else image.convert(mode)
+
+
+class WadFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.open()
+
+    def open(self):
+        self.entries = []
+        self.index = {}
+        self.graphics = {}
+
+        with open(self.path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime_ns
+            self.view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self.read_directory()
+        except Exception:
+            self.close()
+            raise
+
+    def read_directory(self):
+        if len(self.view) < 12:
+            raise ValueError(f"{self.path} is not a WAD file")
+
+        magic, numlumps, infotableofs = HEADER.unpack_from(self.view, 0)
+        if magic not in (b"IWAD", b"PWAD"):
+            raise ValueError(f"{self.path} is not a WAD file")
+        if infotableofs + numlumps * 16 > len(self.view):
+            raise ValueError(f"{self.path} has a truncated directory")
+
+        namespace = None
+        end_marker = None
+        global_graphics = {}
+        marked_graphics = {"patches": {}, "sprites": {}}
+
+        for offset, size, raw_name in ENTRY.iter_unpack(
+            self.view[infotableofs : infotableofs + numlumps * ENTRY.size]
+        ):
+            name = lump_name(raw_name)
+            self.entries.append((name, offset, size))
+            self.index[name] = (offset, size)
+
+            if namespace is None and wccmp(name, "*_START"):
+                namespace = name
+                end_marker = name.replace("START", "END")
+                continue
+            if namespace is not None:
+                if name == end_marker or wccmp(name, namespace[0] + "_END"):
+                    namespace = None
+                    continue
+                group = PICTURE_MARKERS.get(namespace[0])
+                if group is not None and size != 0:
+                    marked_graphics[group][name] = LazyLump(self, name, offset, size, group)
+                continue
+
+            if size != 0 and inwclist(name, GRAPHIC_NAMES):
+                global_graphics[name] = LazyLump(self, name, offset, size, "graphics")
+
+        # Same precedence as WAD.graphics + WAD.patches + WAD.sprites.
+        self.graphics.update(global_graphics)
+        self.graphics.update(marked_graphics["patches"])
+        self.graphics.update(marked_graphics["sprites"])
+
+    def find(self, name: str) -> LazyLump:
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        return LazyLump(self, name, *entry, "global")
+
+    def read(self, offset: int, size: int) -> bytes:
+        return self.view[offset : offset + size]
+
+    def unpack(self, format: str, offset: int) -> tuple:
+        return struct.unpack_from(format, self.view, offset)
+
+    def reload(self):
+        # After the file was rewritten. The old mapping is left to be
+        # collected rather than closed, as a loader thread may still be
+        # reading a lump through it.
+        self.open()
+
+    def close(self):
+        self.view.close()
+
+
+def lump_name(raw_name: bytes) -> str:
+    return raw_name.split(b"\0", 1)[0].decode("ascii", "replace").upper()
+
+
+def replace_lump(path: str, name: str, data: bytes) -> int:
+    # Writes data as the last lump called name, replacing it or adding it,
+    # without touching any other lump. The new lump and a new directory go
+    # into space the current header does not reference; only once they are
+    # on disk is the header patched to point at them, so a crash at any
+    # point leaves either the old or the new WAD. Returns the lump offset.
+    with open(path, "r+b") as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a WAD file")
+        magic, numlumps, infotableofs = HEADER.unpack(header)
+        if magic not in (b"IWAD", b"PWAD"):
+            raise ValueError(f"{path} is not a WAD file")
+
+        file.seek(infotableofs)
+        directory = file.read(numlumps * ENTRY.size)
+        if len(directory) != numlumps * ENTRY.size:
+            raise ValueError(f"{path} has a truncated directory")
+        entries = [list(entry) for entry in ENTRY.iter_unpack(directory)]
+
+        target = None
+        for i, (_, _, raw_name) in enumerate(entries):
+            if lump_name(raw_name) == name:
+                target = i
+
+        # Everything past the last byte of the lumps that stay is either the
+        # current directory, the lump being replaced, or dead space left by
+        # an earlier save.
+        stable_end = HEADER.size
+        for i, (offset, size, _) in enumerate(entries):
+            if i != target and size > 0:
+                stable_end = max(stable_end, offset + size)
+
+        live = [(infotableofs, infotableofs + len(directory))]
+        if target is not None and entries[target][1] > 0:
+            live.append((entries[target][0], entries[target][0] + entries[target][1]))
+
+        if target is None:
+            entries.append([0, 0, name.encode("ascii").ljust(8, b"\0")[:8]])
+            target = len(entries) - 1
+        needed = len(data) + len(entries) * ENTRY.size
+
+        # Saves alternate between the gap in front of the live copy and the
+        # space after it, so the file does not grow with every save.
+        position = stable_end
+        for start, end in sorted(live):
+            if end <= position:
+                continue
+            if position + needed <= start:
+                break
+            position = end
+
+        entries[target][0] = position
+        entries[target][1] = len(data)
+        directory = b"".join(ENTRY.pack(*entry) for entry in entries)
+
+        file.seek(position)
+        file.write(data)
+        file.write(directory)
+        file.flush()
+        os.fsync(file.fileno())
+
+        file.seek(4)
+        file.write(struct.pack("<ii", len(entries), position + len(data)))
+        file.flush()
+        os.fsync(file.fileno())
+
+        # Whatever lies past the new directory is no longer referenced. A
+        # platform that refuses while the file is mapped keeps it until a
+        # later save.
+        try:
+            file.truncate(position + needed)
+        except OSError:
+            pass
+
+    return position